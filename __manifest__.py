@@ -1,13 +1,19 @@
 {
     'name': 'Custom Calendar View',
-    'version': '1.0',
+    'version': '1.8',
     'summary': 'Custom Calendar App to Maximize Products!',
     'description': 'A standalone app to display custom calendar with additional information',
     'author': 'Ali Shidqie AL Faruqi',
     'depends': ['base' ,'mrp', 'sale', 'purchase', 'stock', 'product', ],
     'data': [
         'views\custom_calendar.xml',
+        'views\custom_calendar_rollup.xml',
+        'views\custom_calendar_rebuild.xml',
+        'views\custom_calendar_perf.xml',
+        'views\custom_calendar_shortage.xml',
         'security\ir.model.access.csv',
+        'security\custom_calendar_security.xml',
+        'data\custom_calendar_data.xml',
     ],
     'installable': True,
     'application': True,
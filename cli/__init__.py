@@ -0,0 +1 @@
+from . import calendar_rebuild
@@ -0,0 +1,56 @@
+import argparse
+import logging
+import os
+import sys
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+class CalendarRebuild(Command):
+    """Rebuild the custom calendar report over a date window"""
+
+    def run(self, args):
+        parser = argparse.ArgumentParser(
+            prog='%s calendarrebuild' % sys.argv[0].split(os.path.sep)[-1],
+            description=self.__doc__,
+        )
+        parser.add_argument('-c', '--config', dest='config', help='use a specific configuration file')
+        parser.add_argument('-d', '--database', dest='database', required=True, help='database to rebuild')
+        parser.add_argument('--from', dest='date_from', help='first day of the window (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='last day of the window (YYYY-MM-DD)')
+        parser.add_argument('--domain', dest='domain', default='[]', help='product domain, e.g. "[(\'categ_id\', \'=\', 5)]"')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=200, help='products per committed chunk')
+        parser.add_argument('--workers', dest='workers', type=int, default=1, help='processes rebuilding chunks in parallel')
+        parser.add_argument('--resume', dest='job_id', type=int, help='resume the given interrupted rebuild job')
+        opts = parser.parse_args(args)
+
+        config.parse_config(['-c', opts.config] if opts.config else [])
+        registry = odoo.registry(opts.database)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            Rebuild = env['custom.calendar.rebuild']
+            if opts.job_id:
+                job = Rebuild.browse(opts.job_id).exists()
+                if not job:
+                    parser.error('rebuild job %s does not exist' % opts.job_id)
+                if opts.workers > 1:
+                    job.workers = opts.workers
+            else:
+                if not opts.date_from or not opts.date_to:
+                    parser.error('--from and --to are required unless --resume is given')
+                job = Rebuild.create({
+                    'date_from': opts.date_from,
+                    'date_to': opts.date_to,
+                    'product_domain': opts.domain,
+                    'chunk_size': opts.chunk_size,
+                    'workers': opts.workers,
+                })
+                cr.commit()
+            job._run()
+            print('Rebuild %s %s: %d products, %d rows in %.1fs (%.1f rows/s)' % (
+                job.id, job.state, job.products_done, job.rows_written, job.duration, job.rows_per_second))
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+
+from werkzeug.exceptions import BadRequest
+from werkzeug.http import http_date
+
+import odoo
+from odoo import api, fields, http
+from odoo.http import Response, content_disposition, request
+
+from ..models.custom_calendar import WINDOW_FIELDS
+from ..tools import calendar_export
+from ..tools.calendar_cache import window_cache
+
+# Last-Modified of a window is this instant plus one second per change of its dates, so that it
+# follows the window version rather than wall-clock commit times
+_VERSION_EPOCH = datetime(2000, 1, 1)
+
+# Rows fetched per round trip of the export's server-side cursor
+EXPORT_PAGE_SIZE = 2000
+
+_EXPORT_MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _parse_ids(ids):
+    return sorted({int(record_id) for record_id in ids.split(',') if record_id}) if ids else []
+
+
+def _company_env(company_ids=None):
+    """Return the request environment restricted to the companies selected in the web client.
+
+    ``company_ids`` is an optional comma-separated list, else the ``cids``
+    cookie of the web client is read; either is intersected with the user's
+    companies. Plain HTTP requests would otherwise only see the user's
+    default company.
+    """
+    env = request.env
+    selected = company_ids or request.httprequest.cookies.get('cids') or ''
+    allowed = set(env.user.company_ids.ids)
+    ids = []
+    for company_id in selected.split(','):
+        if company_id.strip().isdigit() and int(company_id) in allowed and int(company_id) not in ids:
+            ids.append(int(company_id))
+    if not ids:
+        return env
+    return env(context=dict(env.context, allowed_company_ids=ids))
+
+
+class CustomCalendarController(http.Controller):
+
+    @http.route('/custom_calendar/report/window', type='http', auth='user', methods=['GET'])
+    def report_window(self, date_from, date_to, product_ids=None, warehouse_ids=None, company_ids=None, **kwargs):
+        """Serve the calendar cells of a date window as compact columnar JSON.
+
+        ``product_ids``, ``warehouse_ids`` and ``company_ids`` are optional
+        comma-separated lists; cells are read for the given companies, else
+        for the ones selected in the web client. Responses carry an ETag and a Last-Modified header derived
+        from the version of the window's dates, not from the time of their
+        changes, so unchanged windows are answered with a 304 before any
+        cell is read. Serialized windows are also kept in a per-worker LRU
+        cache validated against the same version.
+        """
+        date_from, date_to = fields.Date.to_date(date_from), fields.Date.to_date(date_to)
+        product_ids, warehouse_ids = _parse_ids(product_ids), _parse_ids(warehouse_ids)
+        env = _company_env(company_ids)
+        version, __ = env['custom.calendar.version'].sudo()._window_version(date_from, date_to)
+
+        # access rules apply to the cells, so windows are cached per user
+        key = (env.cr.dbname, env.uid, tuple(env.companies.ids), date_from, date_to,
+               tuple(product_ids), tuple(warehouse_ids))
+        etag = hashlib.sha1(json.dumps([str(part) for part in key] + [version]).encode()).hexdigest()
+        last_modified = _VERSION_EPOCH + timedelta(seconds=version)
+        headers = [('ETag', '"%s"' % etag), ('Cache-Control', 'no-cache'), ('Vary', 'Cookie'),
+                   ('Last-Modified', http_date(last_modified))]
+
+        httprequest = request.httprequest
+        if httprequest.if_none_match:
+            not_modified = httprequest.if_none_match.contains(etag)
+        else:
+            # versions only grow: an unchanged window is never older than what the client was sent
+            since = httprequest.if_modified_since
+            not_modified = bool(since and last_modified <= since.replace(tzinfo=None))
+        if not_modified:
+            return request.make_response('', headers=headers, status=304)
+
+        body = window_cache.get(key, version)
+        headers += [('Content-Type', 'application/json'), ('X-Calendar-Cache', 'hit' if body is not None else 'miss')]
+        if body is None:
+            payload = env['custom.calendar.report']._read_window(date_from, date_to, product_ids, warehouse_ids)
+            payload['version'] = version
+            body = json.dumps(payload)
+            max_size = float(env['ir.config_parameter'].sudo().get_param('custom_calendar.window_cache_mb', '64') or 0)
+            if max_size > 0:
+                window_cache.put(key, version, body, max_size * 1024 * 1024)
+        return request.make_response(body, headers=headers)
+
+    @http.route('/custom_calendar/report/window/cache', type='http', auth='user', methods=['GET'])
+    def report_window_cache(self, **kwargs):
+        """Return the hit, miss, invalidation and eviction counters of this worker's window cache."""
+        if not request.env.user.has_group('base.group_system'):
+            return request.not_found()
+        return request.make_response(json.dumps(dict(window_cache.stats(), pid=os.getpid())),
+                                     headers=[('Content-Type', 'application/json'), ('Cache-Control', 'no-store')])
+
+    @http.route('/custom_calendar/report/export', type='http', auth='user', methods=['GET'])
+    def report_export(self, date_from, date_to, product_ids=None, warehouse_ids=None, company_ids=None, layout='rows',
+                      metric='forecast_quantity', file_format='csv', **kwargs):
+        """Stream the calendar cells of a date window as a CSV or XLSX file.
+
+        Filters are those of the JSON window endpoint. With the ``rows``
+        layout every cell is a line with all its metrics; the ``pivot``
+        layout has one line per product and site and one column per day of
+        the window, holding ``metric``. Cells are read
+        through a server-side cursor, a page at a time, and written to the
+        response as they come, so memory use does not grow with the window.
+        """
+        date_from, date_to = fields.Date.to_date(date_from), fields.Date.to_date(date_to)
+        if layout not in ('rows', 'pivot') or file_format not in _EXPORT_MIMETYPES or metric not in WINDOW_FIELDS:
+            raise BadRequest('Unsupported export layout, format or metric.')
+        if file_format == 'xlsx' and calendar_export.xlsxwriter is None:
+            raise BadRequest('XLSX exports require the xlsxwriter library.')
+
+        Report = _company_env(company_ids)['custom.calendar.report']
+        metrics = WINDOW_FIELDS if layout == 'rows' else [metric]
+        # the query is built, with its access rules, in the request; it is only run by the stream
+        query = Report._window_query(date_from, date_to, ['product_id', 'company_id', 'warehouse_id', 'date'] + metrics,
+                                     _parse_ids(product_ids), _parse_ids(warehouse_ids))
+        site_header = [Report._fields[fname].string for fname in ('product_id', 'company_id', 'warehouse_id')]
+        cells = self._export_cells(Report.env, query)
+        if layout == 'rows':
+            header = site_header + [Report._fields['date'].string] + [Report._fields[fname].string for fname in metrics]
+            rows = (list(names) + [fields.Date.to_string(day)] + values for __, names, day, values in cells)
+        else:
+            dates = [date_from + timedelta(days=day) for day in range((date_to - date_from).days + 1)]
+            header = site_header + [fields.Date.to_string(day) for day in dates]
+            series_values = calendar_export.pivot_rows((((series, names), day, values[0]) for series, names, day, values in cells), dates)
+            rows = (list(names) + values for (__, names), values in series_values)
+
+        if file_format == 'csv':
+            stream = calendar_export.csv_chunks(header, rows)
+        else:
+            stream = calendar_export.xlsx_chunks(header, rows)
+        filename = 'calendar_%s_%s_%s.%s' % (layout, date_from, date_to, file_format)
+        return Response(stream, headers=[
+            ('Content-Type', _EXPORT_MIMETYPES[file_format]),
+            ('Content-Disposition', content_disposition(filename)),
+            ('Cache-Control', 'no-store'),
+        ], direct_passthrough=True)
+
+    def _export_cells(self, env, query):
+        """Yield ``(series, names, date, metric values)`` for every row of ``query``.
+
+        ``series`` are the ``(product, company, warehouse)`` ids of the cell
+        and ``names`` their display names. The generator runs while the
+        response is streamed, after the request's cursor is closed, in a
+        cursor of its own with the user and context of ``env``.
+        """
+        dbname, uid, context = env.cr.dbname, env.uid, dict(env.context)
+
+        def cells():
+            with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                site_names = {}
+                with cr._cnx.cursor('custom_calendar_export') as server_cursor:
+                    server_cursor.itersize = EXPORT_PAGE_SIZE
+                    server_cursor.execute(*query)
+                    while True:
+                        page = server_cursor.fetchmany(EXPORT_PAGE_SIZE)
+                        if not page:
+                            break
+                        # names are resolved a page at a time, sites are few and kept
+                        product_names = dict(env['product.product'].browse({row[0] for row in page}).name_get())
+                        for model, position in (('res.company', 1), ('stock.warehouse', 2)):
+                            missing = {row[position] for row in page if row[position] and (model, row[position]) not in site_names}
+                            for record_id, name in env[model].sudo().browse(missing).name_get():
+                                site_names[model, record_id] = name
+                        for row in page:
+                            names = (
+                                product_names.get(row[0], ''),
+                                site_names.get(('res.company', row[1]), ''),
+                                site_names.get(('stock.warehouse', row[2]), ''),
+                            )
+                            yield tuple(row[:3]), names, row[3], [value or 0.0 for value in row[4:]]
+        return cells()
@@ -0,0 +1,38 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+_REF_TABLES = [
+    ('custom_calendar_report_sale_order_rel', 'sale_order_id'),
+    ('custom_calendar_report_purchase_order_rel', 'purchase_order_id'),
+    ('custom_calendar_report_mrp_production_rel', 'mrp_production_id'),
+]
+
+
+def migrate(cr, version):
+    """Merge duplicate (product_id, date) rows before the unique constraint is added."""
+    cr.execute("""
+        SELECT min(id), array_agg(id), sum(sale_order_quantity), sum(purchase_order_quantity), sum(being_manufactured)
+        FROM custom_calendar_report
+        GROUP BY product_id, date
+        HAVING count(*) > 1
+    """)
+    duplicates = cr.fetchall()
+    for keep_id, ids, sale, purchase, manufactured in duplicates:
+        drop_ids = tuple(i for i in ids if i != keep_id)
+        cr.execute("""
+            UPDATE custom_calendar_report
+            SET sale_order_quantity = %s, purchase_order_quantity = %s, being_manufactured = %s
+            WHERE id = %s
+        """, (sale, purchase, manufactured, keep_id))
+        for table, column in _REF_TABLES:
+            cr.execute("SELECT to_regclass(%s)", (table,))
+            if not cr.fetchone()[0]:
+                continue
+            cr.execute("""
+                INSERT INTO {table} (custom_calendar_report_id, {column})
+                SELECT DISTINCT %s, {column} FROM {table} WHERE custom_calendar_report_id IN %s
+                ON CONFLICT DO NOTHING
+            """.format(table=table, column=column), (keep_id, drop_ids))
+        cr.execute("DELETE FROM custom_calendar_report WHERE id IN %s", (drop_ids,))
+    _logger.info('Merged %d duplicated custom calendar report cells', len(duplicates))
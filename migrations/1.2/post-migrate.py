@@ -0,0 +1,22 @@
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1000
+
+
+def migrate(cr, version):
+    """Seed the calendar ledger from the existing pickings and manufacturing orders."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Ledger = env['custom.calendar.ledger']
+    for res_model, domain in [
+        ('stock.picking', [('scheduled_date', '!=', False), ('state', '!=', 'cancel'), ('picking_type_id.code', 'in', ('incoming', 'outgoing'))]),
+        ('mrp.production', [('date_planned_start', '!=', False)]),
+    ]:
+        ids = env[res_model].search(domain, order='id').ids
+        for index in range(0, len(ids), _CHUNK_SIZE):
+            Ledger._sync_documents(env[res_model].browse(ids[index:index + _CHUNK_SIZE]))
+            env.clear()
+        _logger.info('Seeded the calendar ledger from %d %s records', len(ids), res_model)
@@ -0,0 +1,12 @@
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Populate the weekly and monthly rollups from the existing daily cells."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    for model in ('custom.calendar.report.week', 'custom.calendar.report.month'):
+        env[model]._refresh()
@@ -0,0 +1,7 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Build the BoM index and refresh the BoM fields of the existing cells from it."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['custom.calendar.bom.index']._rebuild()
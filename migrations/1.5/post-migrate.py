@@ -0,0 +1,14 @@
+_RELATION_TABLES = (
+    'custom_calendar_report_sale_order_rel',
+    'custom_calendar_report_purchase_order_rel',
+    'custom_calendar_report_mrp_production_rel',
+    'custom_calendar_report_mrp_bom_rel',
+    'custom_calendar_report_product_product_rel',
+)
+
+
+def migrate(cr, version):
+    """Drop the relation tables of the formerly stored reference fields, now read from the ledger and BoM index."""
+    for table in _RELATION_TABLES:
+        cr.execute('DROP TABLE IF EXISTS {}'.format(table))
+    cr.execute('DELETE FROM ir_model_relation WHERE name IN %s', (_RELATION_TABLES,))
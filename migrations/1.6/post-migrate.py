@@ -0,0 +1,62 @@
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+# Set aside by the pre-migration
+_HISTORY_TABLE = 'custom_calendar_report_pre_1_6'
+
+_SUMMED_COLUMNS = ['sale_order_quantity', 'purchase_order_quantity', 'being_manufactured', 'reserved_quantity', 'component_demand']
+_LAST_DAY_COLUMNS = ['stock_on_hand', 'forecast_quantity', 'today_current_stock']
+
+
+def _archive_history(env):
+    """Compact the former daily cells older than the archive cutoff into the archive, for the main company.
+
+    The ledger has no history before the horizon once compacted, so these
+    cells cannot be rebuilt per warehouse like the live ones.
+    """
+    cr = env.cr
+    cr.execute('SELECT to_regclass(%s)', (_HISTORY_TABLE,))
+    if not cr.fetchone()[0]:
+        return
+    date_from = env['custom.calendar.report']._archive_cutoff()
+    if date_from:
+        cr.execute('SELECT column_name FROM information_schema.columns WHERE table_name = %s', (_HISTORY_TABLE,))
+        columns = {row[0] for row in cr.fetchall()}
+        summed = ['sum(coalesce(h.{}, 0))'.format(column) if column in columns else '0' for column in _SUMMED_COLUMNS]
+        last_day = ['(array_agg(h.{} ORDER BY h.date DESC))[1]'.format(column) if column in columns else '0'
+                    for column in _LAST_DAY_COLUMNS]
+        cr.execute("""
+            INSERT INTO custom_calendar_report_archive AS a
+                (product_id, company_id, warehouse_id, date_start, date_stop, {summed_columns},
+                 {last_day_columns}, day_count)
+            SELECT h.product_id, (SELECT min(id) FROM res_company), NULL,
+                   date_trunc('month', h.date)::date,
+                   (date_trunc('month', h.date) + interval '1 month' - interval '1 day')::date,
+                   {summed}, {last_day}, count(*)
+            FROM {table} h
+            WHERE h.date < %s
+            GROUP BY h.product_id, date_trunc('month', h.date)
+            ON CONFLICT (product_id, company_id, (COALESCE(warehouse_id, 0)), date_start) DO UPDATE SET
+                {merge},
+                day_count = a.day_count + EXCLUDED.day_count
+        """.format(
+            table=_HISTORY_TABLE,
+            summed_columns=', '.join(_SUMMED_COLUMNS),
+            last_day_columns=', '.join(_LAST_DAY_COLUMNS),
+            summed=', '.join(summed),
+            last_day=', '.join(last_day),
+            merge=', '.join(['{0} = a.{0} + EXCLUDED.{0}'.format(column) for column in _SUMMED_COLUMNS]
+                            + ['{0} = EXCLUDED.{0}'.format(column) for column in _LAST_DAY_COLUMNS]),
+        ), (date_from,))
+        _logger.info('Archived %d product months of calendar history older than %s', cr.rowcount, date_from)
+    cr.execute('DROP TABLE {}'.format(_HISTORY_TABLE))
+
+
+def migrate(cr, version):
+    """Archive the history out of the live horizon, then rebuild the per-site calendar cells from the ledger."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    _archive_history(env)
+    env['custom.calendar.ledger']._rebuild_cells()
@@ -0,0 +1,76 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# (table, constraint) pairs replaced by the per-site unique indexes
+_CELL_CONSTRAINTS = [
+    ('custom_calendar_report', 'custom_calendar_report_product_date_uniq'),
+    ('custom_calendar_queue', 'custom_calendar_queue_product_date_uniq'),
+    ('custom_calendar_report_week', 'custom_calendar_report_week_product_period_uniq'),
+    ('custom_calendar_report_month', 'custom_calendar_report_month_product_period_uniq'),
+    ('custom_calendar_report_archive', 'custom_calendar_report_archive_product_period_uniq'),
+]
+
+# Daily cells set aside until the post-migration
+_HISTORY_TABLE = 'custom_calendar_report_pre_1_6'
+
+
+def _table_exists(cr, table):
+    cr.execute('SELECT to_regclass(%s)', (table,))
+    return bool(cr.fetchone()[0])
+
+
+def migrate(cr, version):
+    """Key the ledger and the calendar tables by company and warehouse.
+
+    Ledger rows get the company and warehouse of their source document. The
+    daily cells are set aside for the post-migration, which compacts the
+    ones older than the live horizon into the archive and rebuilds the
+    others from the ledger; rollups and queue are emptied. Archived months
+    are assigned to the main company.
+    """
+    for table, constraint in _CELL_CONSTRAINTS:
+        if _table_exists(cr, table):
+            cr.execute('ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}'.format(table, constraint))
+    cr.execute('DELETE FROM ir_model_constraint WHERE name IN %s', (tuple(name for __, name in _CELL_CONSTRAINTS),))
+
+    # installs older than the ledger get it seeded with its sites by the 1.2 post-migration
+    if _table_exists(cr, 'custom_calendar_ledger'):
+        cr.execute("""
+            ALTER TABLE custom_calendar_ledger
+                ADD COLUMN IF NOT EXISTS company_id integer,
+                ADD COLUMN IF NOT EXISTS warehouse_id integer
+        """)
+        cr.execute("""
+            UPDATE custom_calendar_ledger l
+            SET company_id = sp.company_id, warehouse_id = spt.warehouse_id
+            FROM stock_picking sp
+            LEFT JOIN stock_picking_type spt ON spt.id = sp.picking_type_id
+            WHERE l.res_model = 'stock.picking' AND sp.id = l.res_id
+        """)
+        cr.execute("""
+            UPDATE custom_calendar_ledger l
+            SET company_id = mp.company_id, warehouse_id = spt.warehouse_id
+            FROM mrp_production mp
+            LEFT JOIN stock_picking_type spt ON spt.id = mp.picking_type_id
+            WHERE l.res_model = 'mrp.production' AND mp.id = l.res_id
+        """)
+        # rows of deleted documents would have been dropped by their next sync
+        cr.execute('DELETE FROM custom_calendar_ledger WHERE company_id IS NULL')
+        _logger.info('Dropped %d orphan custom calendar ledger rows', cr.rowcount)
+
+    if _table_exists(cr, 'custom_calendar_report_archive'):
+        cr.execute('ALTER TABLE custom_calendar_report_archive ADD COLUMN IF NOT EXISTS company_id integer')
+        cr.execute('UPDATE custom_calendar_report_archive SET company_id = (SELECT min(id) FROM res_company)')
+
+    if _table_exists(cr, 'custom_calendar_report'):
+        cr.execute('DROP TABLE IF EXISTS {}'.format(_HISTORY_TABLE))
+        cr.execute('CREATE TABLE {} AS SELECT * FROM custom_calendar_report'.format(_HISTORY_TABLE))
+    for table in ('custom_calendar_report', 'custom_calendar_report_week', 'custom_calendar_report_month', 'custom_calendar_queue'):
+        if _table_exists(cr, table):
+            cr.execute('DELETE FROM {}'.format(table))
+    if _table_exists(cr, 'custom_calendar_version'):
+        cr.execute("""
+            UPDATE custom_calendar_version
+            SET version = version + 1, changed_at = now() at time zone 'UTC'
+        """)
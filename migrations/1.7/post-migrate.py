@@ -0,0 +1,8 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Detect the shortages of the existing calendar cells."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute('SELECT DISTINCT product_id FROM custom_calendar_report')
+    env['custom.calendar.shortage']._refresh([row[0] for row in cr.fetchall()])
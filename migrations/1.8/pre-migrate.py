@@ -0,0 +1,10 @@
+def migrate(cr, version):
+    """Turn the per-date version rows into an insert-only change log.
+
+    The existing rows keep their versions, which only ever grow, as the
+    first change of their date; the per-date unique constraint and the
+    sequence the versions were drawn from are dropped.
+    """
+    cr.execute('ALTER TABLE IF EXISTS custom_calendar_version DROP CONSTRAINT IF EXISTS custom_calendar_version_date_uniq')
+    cr.execute("DELETE FROM ir_model_constraint WHERE name = 'custom_calendar_version_date_uniq'")
+    cr.execute('DROP SEQUENCE IF EXISTS custom_calendar_version_seq')
@@ -1 +1,10 @@
 from . import custom_calendar
+from . import custom_calendar_bom_index
+from . import custom_calendar_ledger
+from . import custom_calendar_perf
+from . import custom_calendar_queue
+from . import custom_calendar_rebuild
+from . import custom_calendar_rollup
+from . import custom_calendar_rollup_archive
+from . import custom_calendar_shortage
+from . import custom_calendar_version
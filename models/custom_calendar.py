@@ -1,9 +1,52 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from .custom_calendar_ledger import LEDGER_METRICS
+from .custom_calendar_rollup import ROLLUP_MODELS
+from ..tools.calendar_aggregate import project_stock
+from ..tools.calendar_log import log_batch, log_event
+from ..tools.calendar_perf import instrumented
+from psycopg2.extras import execute_values
+from collections import defaultdict
 from datetime import datetime, timedelta
 import logging
 
 _logger = logging.getLogger(__name__)
 
+_UPSERT_FIELDS = ['sale_order_quantity', 'purchase_order_quantity', 'being_manufactured']
+
+# Only writes on these fields can change the calendar cells of a document
+_CALENDAR_PICKING_FIELDS = {'scheduled_date', 'move_lines', 'move_ids_without_package', 'picking_type_id', 'state'}
+_CALENDAR_PRODUCTION_FIELDS = {'date_planned_start', 'product_id', 'product_qty', 'product_uom_id', 'picking_type_id', 'state'}
+
+# Calendar cells are keyed by (product_id, company_id, warehouse_id, date), warehouse_id being None when
+# the source document is not bound to a warehouse.
+
+# Keys of the per-transaction dirty cells and source documents
+_DIRTY_KEYS = 'custom.calendar.report.dirty'
+_DIRTY_DOCUMENTS = 'custom.calendar.report.dirty_documents'
+
+# Key of the per-transaction cache of product stock figures
+_STOCK_CACHE = 'custom.calendar.report.stock'
+
+# Projections work on day numbers counted from this date
+_EPOCH = datetime(1970, 1, 1).date()
+_PROJECTION_FIELDS = ['stock_on_hand', 'forecast_quantity', 'today_current_stock']
+
+# Metric columns of the window payload served to the calendar and of the exports
+WINDOW_FIELDS = [
+    'sale_order_quantity', 'purchase_order_quantity', 'being_manufactured', 'reserved_quantity',
+    'stock_on_hand', 'forecast_quantity', 'today_current_stock', 'bom_quantity', 'component_demand',
+]
+
+
+def _empty_flow():
+    return {
+        'sale_order_quantity': 0.0,
+        'purchase_order_quantity': 0.0,
+        'being_manufactured': 0.0,
+        'reserved_quantity': 0.0,
+    }
+
+
 class CustomCalendarReport(models.Model):
     _name = 'custom.calendar.report'
     _description = 'Custom Calendar Report'
@@ -11,502 +54,908 @@ class CustomCalendarReport(models.Model):
 
     date = fields.Date(string='Date', required=True)
     product_id = fields.Many2one('product.product', string='Product', required=True)
-    sale_order_quantity = fields.Float(string='Sale Order Quantity', compute='_compute_sale_order_quantity', store=True)
-    purchase_order_quantity = fields.Float(string='Purchase Order Quantity', compute='_compute_purchase_order_quantity', store=True)
-    stock_on_hand = fields.Float(string='Stock on Hand', compute='_compute_stock_on_hand', store=True)
-    being_manufactured = fields.Float(string='Being Manufactured', compute='_compute_being_manufactured', store=True)
-    reserved_quantity = fields.Float(string='Reserved Quantity', compute='_compute_reserved_quantity', store=True)
+    company_id = fields.Many2one('res.company', string='Company', required=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string='Warehouse')
+    sale_order_quantity = fields.Float(string='Sale Order Quantity', compute='_compute_calendar_metrics', store=True)
+    purchase_order_quantity = fields.Float(string='Purchase Order Quantity', compute='_compute_calendar_metrics', store=True)
+    stock_on_hand = fields.Float(string='Stock on Hand', compute='_compute_projection', store=True)
+    being_manufactured = fields.Float(string='Being Manufactured', compute='_compute_calendar_metrics', store=True)
+    reserved_quantity = fields.Float(string='Reserved Quantity', compute='_compute_calendar_metrics', store=True)
     bom_quantity = fields.Float(string='BoM Quantity', compute='_compute_bom_quantity', store=True)
-    forecast_quantity = fields.Float(string='Forecast Quantity', compute='_compute_forecast_quantity', store=True)
-    today_current_stock = fields.Float(string='Current Stock\'s Left', compute='_compute_today_current_stock', store=True)    
-    sale_order_refs = fields.Many2many('sale.order', string='Sale Orders', compute='_compute_sale_order_quantity', store=True)
-    purchase_order_refs = fields.Many2many('purchase.order', string='Purchase Orders', compute='_compute_purchase_order_quantity', store=True)
-    manufacturing_order_refs = fields.Many2many('mrp.production', string='Manufacturing Orders', compute='_compute_being_manufactured', store=True)
-    bom_refs = fields.Many2many('mrp.bom', string='BoMs', compute='_compute_bom_quantity', store=True)
-    used_in_refs = fields.Many2many('product.product', string='Used In Products', compute='_compute_used_in_refs', store=True)
-
-    @api.depends('product_id', 'date')
-    def _compute_sale_order_quantity(self):
-        for record in self:
-            start_of_day = datetime.combine(record.date, datetime.min.time())
-            end_of_day = start_of_day + timedelta(days=1)
-
-            _logger.info('Computing sale_order_quantity for product_id: %s on date: %s', record.product_id.id, record.date)
-
-            pickings = self.env['stock.picking'].search([
-                ('move_lines.product_id', '=', record.product_id.id),
-                ('picking_type_id.code', '=', 'outgoing'),
-                ('scheduled_date', '>=', start_of_day),
-                ('scheduled_date', '<', end_of_day),
-                ('state', '!=', 'cancel')
-            ])
-
-            _logger.info('Found %d pickings for sale orders', len(pickings))
-            
-            sale_order_lines = pickings.mapped('move_lines.sale_line_id')
-            record.sale_order_quantity = sum(line.product_uom_qty for line in sale_order_lines) or 0.0
-            record.sale_order_refs = [(6, 0, sale_order_lines.mapped('order_id').ids)]
-
-            _logger.info('Computed sale_order_quantity: %s', record.sale_order_quantity)
-            _logger.info('Sale order references: %s', record.sale_order_refs)
-
-    @api.depends('product_id', 'date')
-    def _compute_purchase_order_quantity(self):
-        for record in self:
-            start_of_day = datetime.combine(record.date, datetime.min.time())
-            end_of_day = start_of_day + timedelta(days=1)
-
-            _logger.info('Computing purchase_order_quantity for product_id: %s on date: %s', record.product_id.id, record.date)
-
-            pickings = self.env['stock.picking'].search([
-                ('move_lines.product_id', '=', record.product_id.id),
-                ('picking_type_id.code', '=', 'incoming'),
-                ('scheduled_date', '>=', start_of_day),
-                ('scheduled_date', '<', end_of_day),
-                ('state', '!=', 'cancel')
-            ])
-
-            _logger.info('Found %d pickings for purchase orders', len(pickings))
-            
-            purchase_order_lines = pickings.mapped('move_lines.purchase_line_id')
-            record.purchase_order_quantity = sum(line.product_qty for line in purchase_order_lines) or 0.0
-            record.purchase_order_refs = [(6, 0, purchase_order_lines.mapped('order_id').ids)]
-
-            _logger.info('Computed purchase_order_quantity: %s', record.purchase_order_quantity)
-            _logger.info('Purchase order references: %s', record.purchase_order_refs)
-            
-    @api.depends('product_id', 'date')
-    def _compute_stock_on_hand(self):
-        for record in self:
-            product = record.product_id
-            record.stock_on_hand = product.qty_available or 0.0
-            _logger.info('Computed stock_on_hand: %s for product_id: %s on date: %s', record.stock_on_hand, record.product_id.id, record.date)
+    forecast_quantity = fields.Float(string='Forecast Quantity', compute='_compute_projection', store=True)
+    today_current_stock = fields.Float(string='Current Stock\'s Left', compute='_compute_projection', store=True)    
+    # document references are not stored: they are read from the ledger and the BoM index when displayed
+    sale_order_refs = fields.Many2many('sale.order', string='Sale Orders', compute='_compute_document_refs')
+    purchase_order_refs = fields.Many2many('purchase.order', string='Purchase Orders', compute='_compute_document_refs')
+    manufacturing_order_refs = fields.Many2many('mrp.production', string='Manufacturing Orders', compute='_compute_document_refs')
+    bom_refs = fields.Many2many('mrp.bom', string='BoMs', compute='_compute_bom_refs')
+    used_in_refs = fields.Many2many('product.product', string='Used In Products', compute='_compute_used_in_refs')
+    component_demand = fields.Float(string='Component Demand', compute='_compute_component_demand', store=True,
+                                    help='Quantity needed by the manufacturing orders of the products using this one as a component, across all BoM levels.')
+
+    def init(self):
+        cr = self.env.cr
+        # one row per cell; a NULL warehouse is a site of its own
+        cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS custom_calendar_report_cell_uniq
+            ON custom_calendar_report (product_id, company_id, (COALESCE(warehouse_id, 0)), date)
+        """)
+        # per-site windows are read from the index alone where covering indexes are supported
+        if not tools.index_exists(cr, 'custom_calendar_report_site_date_index'):
+            include = ''
+            if cr._cnx.server_version >= 110000:
+                include = 'INCLUDE (product_id, {})'.format(', '.join(WINDOW_FIELDS))
+            cr.execute("""
+                CREATE INDEX custom_calendar_report_site_date_index
+                ON custom_calendar_report (company_id, warehouse_id, date) {}
+            """.format(include))
+
+    def _cell_key(self):
+        """Return the ``(product_id, company_id, warehouse_id, date)`` key of this cell."""
+        self.ensure_one()
+        return (self.product_id.id, self.company_id.id, self.warehouse_id.id or None, self.date)
 
+    @api.model
+    def _upsert_quantities(self, deltas):
+        """Atomically add quantities to calendar cells, creating the missing ones.
+
+        ``deltas`` maps cell keys to a dict of increments for
+        ``sale_order_quantity``, ``purchase_order_quantity`` and
+        ``being_manufactured``. Concurrent callers are serialized by the
+        cell unique index through ``INSERT ... ON CONFLICT``.
+        Returns the upserted cells.
+        """
+        if not deltas:
+            return self.browse()
+        self.flush(_UPSERT_FIELDS)
+        values = [
+            key + tuple(delta.get(fname, 0.0) for fname in _UPSERT_FIELDS) + (self.env.uid, self.env.uid)
+            for key, delta in deltas.items()
+        ]
+        rows = execute_values(self.env.cr._obj, """
+            INSERT INTO custom_calendar_report AS ccr
+                (product_id, company_id, warehouse_id, date, sale_order_quantity, purchase_order_quantity,
+                 being_manufactured, create_uid, write_uid, create_date, write_date)
+            SELECT v.product_id, v.company_id, v.warehouse_id::integer, v.date::date, v.sale, v.purchase, v.manufactured,
+                   v.uid, v.write_uid, now() at time zone 'UTC', now() at time zone 'UTC'
+            FROM (VALUES %s) AS v (product_id, company_id, warehouse_id, date, sale, purchase, manufactured, uid, write_uid)
+            ON CONFLICT (product_id, company_id, (COALESCE(warehouse_id, 0)), date) DO UPDATE SET
+                sale_order_quantity = COALESCE(ccr.sale_order_quantity, 0) + EXCLUDED.sale_order_quantity,
+                purchase_order_quantity = COALESCE(ccr.purchase_order_quantity, 0) + EXCLUDED.purchase_order_quantity,
+                being_manufactured = COALESCE(ccr.being_manufactured, 0) + EXCLUDED.being_manufactured,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+            RETURNING id, (xmax = 0) AS inserted
+        """, values, fetch=True)
+
+        reports = self.browse([row[0] for row in rows])
+        created = self.browse([row[0] for row in rows if row[1]])
+        reports.invalidate_cache(_UPSERT_FIELDS)
+        reports.modified(_UPSERT_FIELDS)
+        if created:
+            # rows inserted in SQL never went through create(): compute their other fields
+            for fname in ('reserved_quantity', 'bom_quantity'):
+                self.env.add_to_compute(self._fields[fname], created)
+        _logger.debug('Upserted %d calendar report rows (%d created)', len(reports), len(created))
+        return reports
 
-    @api.depends('product_id', 'date')
-    def _compute_being_manufactured(self):
-        for record in self:
-            start_of_day = datetime.combine(record.date, datetime.min.time())
-            end_of_day = start_of_day + timedelta(days=1)
+    @api.model
+    def _mark_dirty(self, keys=None, documents=None):
+        """Queue cells for recomputation at the end of the transaction.
+
+        ``keys`` are cell keys and ``documents`` source
+        records whose ledger rows must be synced first. Both are deduplicated
+        per transaction and drained in one batch by a precommit hook; the
+        cells are handed over to the queue cron instead when the
+        ``custom_calendar.update_mode`` system parameter is ``cron``.
+        """
+        if not keys and not documents:
+            return
+        data = self.env.cr.precommit.data
+        if _DIRTY_KEYS not in data:
+            data[_DIRTY_KEYS] = set()
+            data[_DIRTY_DOCUMENTS] = defaultdict(set)
+            self.env.cr.precommit.add(self.sudo()._flush_dirty)
+        data[_DIRTY_KEYS].update(keys or ())
+        if documents:
+            data[_DIRTY_DOCUMENTS][documents._name].update(documents.ids)
+
+    @instrumented('CustomCalendarReport._flush_dirty')
+    def _flush_dirty(self):
+        data = self.env.cr.precommit.data
+        keys = data.pop(_DIRTY_KEYS, set())
+        documents = data.pop(_DIRTY_DOCUMENTS, {})
+        with log_batch('calendar.flush_dirty', documents=sum(len(ids) for ids in documents.values())) as summary:
+            for res_model, res_ids in documents.items():
+                keys |= self.env['custom.calendar.ledger']._sync_documents(self.env[res_model].browse(res_ids))
+            summary['cells'] = len(keys)
+            if not keys:
+                return
+            mode = self.env['ir.config_parameter'].sudo().get_param('custom_calendar.update_mode', 'commit')
+            summary['mode'] = mode
+            if mode == 'cron':
+                self.env['custom.calendar.queue']._enqueue(keys)
+            else:
+                self._recompute_cells(keys)
+            self.flush()
+            summary['rows'] = len(keys)
+
+    @api.model
+    def _component_keys(self, keys):
+        """Return the cells of the components, at any BoM level, of the products of ``keys`` on the same sites and dates."""
+        cells_by_product = defaultdict(set)
+        for product_id, company_id, warehouse_id, date in keys:
+            cells_by_product[product_id].add((company_id, warehouse_id, date))
+        self.env['custom.calendar.bom.index'].flush()
+        self.env.cr.execute("""
+            SELECT DISTINCT parent_product_id, component_id FROM custom_calendar_bom_index
+            WHERE parent_product_id IN %s AND level > 0
+        """, (tuple(cells_by_product),))
+        return {
+            (component_id,) + cell
+            for parent_id, component_id in self.env.cr.fetchall()
+            for cell in cells_by_product[parent_id]
+        }
+
+    @api.model
+    @instrumented('CustomCalendarReport._recompute_cells')
+    def _recompute_cells(self, keys):
+        """Recompute the given cells in one batch, creating and removing rows as needed."""
+        if not keys:
+            return self.browse()
+        with log_batch('calendar.recompute_cells', cells=len(keys)) as summary:
+            # parallel rebuild shards only write their own products' cells
+            if not self.env.context.get('calendar_skip_components'):
+                keys = keys | self._component_keys(keys)
+            keys = self._filter_live_keys(keys)
+            if not keys:
+                return self.browse()
+            dates = {key[-1] for key in keys}
+            # cells of every company, whatever the companies selected in the session
+            existing = self.sudo().search([
+                ('product_id', 'in', list({key[0] for key in keys})),
+                ('company_id', 'in', list({key[1] for key in keys})),
+                ('date', '>=', min(dates)),
+                ('date', '<=', max(dates)),
+            ]).filtered(lambda r: r._cell_key() in keys)
+            existing_keys = {report._cell_key() for report in existing}
+            created = self._upsert_quantities({key: {} for key in keys if key not in existing_keys})
+            reports = existing | created
+
+            # the projection is recomputed below for whole products, not per cell
+            for field in self._fields.values():
+                if field.compute and field.store and field.name not in _PROJECTION_FIELDS:
+                    self.env.add_to_compute(field, reports)
+            # the upsert marked them through their dependencies on the quantities
+            for fname in _PROJECTION_FIELDS:
+                self.env.remove_to_compute(self._fields[fname], reports)
+            self.recompute()
+            self._unlink_empty_reports(reports)
+            # projected stock is cumulative: a changed cell shifts every other cell of its product
+            projected_keys = self._recompute_projection({key[0] for key in keys})
+            self._notify_cells_changed(keys | projected_keys)
+            summary.update(rows=len(reports) + len(projected_keys), created=len(created))
+        return reports.exists()
 
-            _logger.info('Computing being_manufactured for product_id: %s on date: %s', record.product_id.id, record.date)
+    @api.model
+    def _live_horizon(self):
+        """Return the first and last day of the live horizon, either being None when unbounded.
+
+        Days are counted from today with the ``custom_calendar.horizon_past_days``
+        and ``custom_calendar.horizon_future_days`` system parameters.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        today = fields.Date.context_today(self)
+        past_days = ICP.get_param('custom_calendar.horizon_past_days')
+        future_days = ICP.get_param('custom_calendar.horizon_future_days')
+        return (
+            today - timedelta(days=int(past_days)) if past_days else None,
+            today + timedelta(days=int(future_days)) if future_days else None,
+        )
 
-            productions = self.env['mrp.production'].search([
-                ('product_id', '=', record.product_id.id),
-                ('date_planned_start', '>=', start_of_day),
-                ('date_planned_start', '<', end_of_day)
-            ])
+    @api.model
+    def _archive_cutoff(self):
+        """Return the first day kept in the daily table and the ledger, None when the past is unbounded.
 
-            _logger.info('Found %d manufacturing orders', len(productions))
+        It is the Monday of the first day of the live horizon: only whole
+        weeks are archived, so no weekly rollup spans archived days.
+        """
+        date_from, __ = self._live_horizon()
+        return date_from and date_from - timedelta(days=date_from.weekday())
 
-            # New logic: Sum of product_qty for the manufacturing orders
-            record.being_manufactured = sum(production.product_qty for production in productions) or 0.0
-            record.manufacturing_order_refs = [(6, 0, productions.ids)]
+    @api.model
+    def _filter_live_keys(self, keys):
+        """Drop the cells outside of the live horizon."""
+        date_from, date_to = self._live_horizon()
+        return {
+            key for key in keys
+            if (not date_from or key[-1] >= date_from) and (not date_to or key[-1] <= date_to)
+        }
 
-            _logger.info('Computed being_manufactured: %s', record.being_manufactured)
+    @api.model
+    def _cron_apply_horizon(self):
+        """Keep the daily cells within the live horizon.
+
+        Cells of the weeks older than the horizon are compacted into the
+        monthly archive, and their ledger rows into opening balances. Days
+        entering the horizon at its far end are materialized from the
+        ledger; the first run instead drops the cells beyond it.
+        """
+        date_from, date_to = self._live_horizon()
+        cutoff = self._archive_cutoff()
+        if cutoff:
+            self.env['custom.calendar.report.archive']._compact(cutoff)
+            self.env['custom.calendar.ledger']._compact(cutoff)
+        if not date_to:
+            return
+        ICP = self.env['ir.config_parameter'].sudo()
+        materialized_until = fields.Date.to_date(ICP.get_param('custom_calendar.horizon_materialized_until'))
+        if not materialized_until:
+            self.flush()
+            self.env.cr.execute("""
+                DELETE FROM custom_calendar_report WHERE date > %s
+                RETURNING product_id, company_id, warehouse_id, date
+            """, (date_to,))
+            keys = set(self.env.cr.fetchall())
+            self.invalidate_cache()
+            self._notify_cells_changed(keys)
+            self.env['custom.calendar.shortage']._refresh({key[0] for key in keys})
+        elif materialized_until < date_to:
+            self.env['custom.calendar.ledger']._rebuild_cells(date_from=materialized_until + timedelta(days=1), date_to=date_to)
+        ICP.set_param('custom_calendar.horizon_materialized_until', fields.Date.to_string(date_to))
+        self.flush()
+        self.env.cr.commit()
 
-    @api.depends('product_id', 'date')
-    def _compute_reserved_quantity(self):
-        for record in self:
-            start_of_day = datetime.combine(record.date, datetime.min.time())
-            end_of_day = start_of_day + timedelta(days=1)
+    @api.model
+    def _notify_cells_changed(self, keys):
+        """Propagate changed cells to the rollups and to the version of their dates."""
+        for rollup_model in ROLLUP_MODELS:
+            self.env[rollup_model]._refresh(keys)
+        self.env['custom.calendar.version']._bump({key[-1] for key in keys})
 
-            _logger.info('Computing reserved quantity for product_id: %s on date: %s', record.product_id.id, record.date)
+    @api.model
+    def _unlink_empty_reports(self, reports):
+        """Delete the given cells once none of their flows is left."""
+        empty = reports.exists().filtered(lambda r: not any([
+            r.sale_order_quantity,
+            r.purchase_order_quantity,
+            r.being_manufactured,
+            r.component_demand,
+        ]))
+        if empty:
+            _logger.debug('Unlinking %d calendar report rows as all quantities are zero', len(empty))
+            empty.unlink()
 
-            # Find relevant stock moves for calculating reserved quantity
-            reserved_moves = self.env['stock.move'].search([
-                ('product_id', '=', record.product_id.id),
-                ('state', '=', 'assigned'),  # Modify state to 'assigned' for reserved quantities
-                ('date_deadline', '>=', start_of_day),
-                ('date_deadline', '<', end_of_day),
-            ])
+    @api.model
+    def _read_calendar_flows(self, product_ids, date_from, date_to):
+        """Load the daily flows of ``product_ids`` between ``date_from`` and ``date_to`` (inclusive).
+
+        Sale, purchase and manufacturing flows are summed from the ledger and
+        reserved moves are fetched with a single search; both are bucketed in
+        memory by cell key, the sites of a product in the same pass.
+        """
+        start = datetime.combine(date_from, datetime.min.time())
+        end = datetime.combine(date_to, datetime.min.time()) + timedelta(days=1)
+        flows = defaultdict(_empty_flow)
+
+        totals = self.env['custom.calendar.ledger']._read_totals(product_ids, date_from, date_to)
+        for key, metrics in totals.items():
+            for metric, quantity in metrics.items():
+                flows[key][metric] += quantity
+
+        reserved_moves = self.env['stock.move'].search([
+            ('product_id', 'in', product_ids),
+            ('state', '=', 'assigned'),
+            ('date_deadline', '>=', start),
+            ('date_deadline', '<', end),
+        ])
+        for move in reserved_moves:
+            key = (move.product_id.id, move.company_id.id, move.picking_type_id.warehouse_id.id or None, move.date_deadline.date())
+            flows[key]['reserved_quantity'] += move.product_uom_qty
+
+        _logger.debug('Loaded calendar flows for %d products between %s and %s: %d ledger cells, %d reserved moves',
+                     len(product_ids), date_from, date_to, len(totals), len(reserved_moves))
+        return flows
 
-            _logger.info('Found %d stock moves for reserved quantity', len(reserved_moves))
+    @api.model
+    def _stock_cache_key(self):
+        # stock figures depend on the allowed companies and the location/warehouse in context
+        return (tuple(self.env.companies.ids), self.env.context.get('location'), self.env.context.get('warehouse'))
 
-            # Calculate and store the reserved quantity
-            record.reserved_quantity = sum(move.product_uom_qty for move in reserved_moves) or 0.0
+    @api.model
+    def _get_stock_figures(self, product_ids):
+        """Return ``{product_id: (qty_available, virtual_available)}`` for ``product_ids``.
+
+        Missing products are fetched together through one grouped quant/move
+        read and memoized for the rest of the transaction, until
+        :meth:`_invalidate_stock_figures` drops them.
+        """
+        cache = self.env.cr.precommit.data.setdefault(_STOCK_CACHE, {}).setdefault(self._stock_cache_key(), {})
+        missing = [product_id for product_id in product_ids if product_id not in cache]
+        if missing:
+            quantities = self.env['product.product'].browse(missing)._compute_quantities_dict(
+                self.env.context.get('lot_id'), self.env.context.get('owner_id'), self.env.context.get('package_id'))
+            for product_id in missing:
+                figures = quantities.get(product_id, {})
+                cache[product_id] = (figures.get('qty_available', 0.0), figures.get('virtual_available', 0.0))
+        return {product_id: cache[product_id] for product_id in product_ids}
 
-            _logger.info('Computed reserved quantity: %s', record.reserved_quantity)
+    @api.model
+    def _invalidate_stock_figures(self, product_ids):
+        for cache in self.env.cr.precommit.data.get(_STOCK_CACHE, {}).values():
+            for product_id in product_ids:
+                cache.pop(product_id, None)
+
+    @api.depends('product_id', 'company_id', 'warehouse_id', 'date')
+    @instrumented('CustomCalendarReport._compute_calendar_metrics')
+    def _compute_calendar_metrics(self):
+        """Compute all date-based metrics of the recordset in one batched pass."""
+        records = self.filtered(lambda r: r.product_id and r.date)
+        (self - records).update({
+            'sale_order_quantity': 0.0,
+            'purchase_order_quantity': 0.0,
+            'being_manufactured': 0.0,
+            'reserved_quantity': 0.0,
+        })
+        if not records:
+            return
+
+        products = records.mapped('product_id')
+        dates = records.mapped('date')
+        flows = self._read_calendar_flows(products.ids, min(dates), max(dates))
+
+        for record in records:
+            flow = flows.get(record._cell_key()) or _empty_flow()
+            record.update({
+                'sale_order_quantity': flow['sale_order_quantity'],
+                'purchase_order_quantity': flow['purchase_order_quantity'],
+                'being_manufactured': flow['being_manufactured'],
+                'reserved_quantity': flow['reserved_quantity'],
+            })
+
+        _logger.debug('Computed calendar metrics for %d report rows (%d products)', len(records), len(products))
+
+    @api.model
+    def _read_product_boms(self, product_ids):
+        """Return ``{product_id: (bom ids, total quantity)}`` of the products' own BoMs from the BoM index."""
+        self.env['custom.calendar.bom.index'].flush()
+        self.env.cr.execute("""
+            SELECT parent_product_id, array_agg(bom_id), sum(quantity)
+            FROM custom_calendar_bom_index
+            WHERE parent_product_id IN %s AND level = 0
+            GROUP BY parent_product_id
+        """, (tuple(product_ids) or (None,),))
+        return {product_id: (bom_ids, quantity) for product_id, bom_ids, quantity in self.env.cr.fetchall()}
 
-    
     @api.depends('product_id')
+    @instrumented('CustomCalendarReport._compute_bom_quantity')
     def _compute_bom_quantity(self):
+        boms_by_product = self._read_product_boms(self.mapped('product_id').ids)
         for record in self:
-            _logger.info('Computing bom_quantity for product_id: %s', record.product_id.id)
-
-            boms = self.env['mrp.bom'].search([
-                ('product_tmpl_id', '=', record.product_id.product_tmpl_id.id)
-            ])
+            record.bom_quantity = boms_by_product.get(record.product_id.id, ([], 0.0))[1] or 0.0
 
-            bom_quantity = sum(bom.product_qty for bom in boms) or 0.0
-            record.bom_quantity = bom_quantity
-            record.bom_refs = [(6, 0, boms.ids)]
+        _logger.debug('Computed bom_quantity for %d report rows', len(self))
 
-            _logger.info('Computed bom_quantity: %s', record.bom_quantity)
-            _logger.info('BoM references: %s', record.bom_refs)
+    @api.depends('product_id')
+    def _compute_bom_refs(self):
+        boms_by_product = self._read_product_boms(self.mapped('product_id').ids)
+        for record in self:
+            record.bom_refs = [(6, 0, boms_by_product.get(record.product_id.id, ([], 0.0))[0])]
+
+    @api.depends('product_id', 'company_id', 'warehouse_id', 'date')
+    def _compute_document_refs(self):
+        """Resolve the sale, purchase and manufacturing orders of each cell from its ledger rows."""
+        records = self.filtered(lambda r: r.product_id and r.date)
+        refs = {}
+        if records:
+            dates = records.mapped('date')
+            refs = self.env['custom.calendar.ledger']._read_refs(records.mapped('product_id').ids, min(dates), max(dates))
+        for record in self:
+            metrics = refs.get(record._cell_key(), {})
+            record.update({
+                fname: [(6, 0, metrics.get(metric, []))]
+                for metric, fname in LEDGER_METRICS.items()
+            })
 
     @api.depends('product_id')
+    @instrumented('CustomCalendarReport._compute_used_in_refs')
     def _compute_used_in_refs(self):
+        used_in = self.env['custom.calendar.bom.index']._read_used_in(self.mapped('product_id').ids or [None])
         for record in self:
-            _logger.info('Computing used_in_refs for product_id: %s', record.product_id.id)
+            parent_ids = {parent_id for parent_id, level, __ in used_in.get(record.product_id.id, []) if level == 1}
+            record.used_in_refs = [(6, 0, list(parent_ids))]
+
+        _logger.debug('Computed used_in_refs for %d report rows', len(self))
+
+    @api.depends('product_id', 'company_id', 'warehouse_id', 'date')
+    @instrumented('CustomCalendarReport._compute_component_demand')
+    def _compute_component_demand(self):
+        """Roll the manufacturing orders of every product using the row's product, at any BoM level, up into its demand."""
+        records = self.filtered(lambda r: r.product_id and r.date)
+        (self - records).component_demand = 0.0
+        if not records:
+            return
+        used_in = self.env['custom.calendar.bom.index']._read_used_in(records.mapped('product_id').ids)
+        parent_ids = {parent_id for rows in used_in.values() for parent_id, __, __ in rows}
+        manufactured = {}
+        if parent_ids:
+            dates = records.mapped('date')
+            totals = self.env['custom.calendar.ledger']._read_totals(list(parent_ids), min(dates), max(dates))
+            manufactured = {key: metrics['being_manufactured'] for key, metrics in totals.items() if 'being_manufactured' in metrics}
+
+        for record in records:
+            __, company_id, warehouse_id, date = record._cell_key()
+            record.component_demand = sum(
+                manufactured.get((parent_id, company_id, warehouse_id, date), 0.0) * quantity
+                for parent_id, __, quantity in used_in.get(record.product_id.id, [])
+            )
 
-            used_in = self.env['mrp.bom.line'].search([
-                ('product_id', '=', record.product_id.id)
-            ]).mapped('bom_id.product_tmpl_id.product_variant_id')
+    @api.model
+    def _recompute_bom_fields(self, product_ids):
+        """Recompute the BoM-derived fields of every cell of ``product_ids`` after a BoM index change.
+
+        Cells left without any flow are deleted, and the cells of components
+        newly demanded by the manufacturing orders of ``product_ids`` are
+        created.
+        """
+        if not product_ids:
+            return
+        reports = self.sudo().search([('product_id', 'in', list(product_ids))])
+        for fname in ('bom_quantity', 'component_demand'):
+            self.env.add_to_compute(self._fields[fname], reports)
+        self.recompute()
+        keys = {report._cell_key() for report in reports}
+        self._unlink_empty_reports(reports)
+        self._notify_cells_changed(keys)
+
+        self.env['custom.calendar.ledger'].flush()
+        self.env.cr.execute("""
+            SELECT DISTINCT product_id, company_id, warehouse_id, date FROM custom_calendar_ledger
+            WHERE metric = 'being_manufactured' AND product_id IN %s
+        """, (tuple(product_ids),))
+        manufactured_keys = set(self.env.cr.fetchall())
+        if manufactured_keys:
+            self._recompute_cells(self._component_keys(manufactured_keys) - keys)
 
-            record.used_in_refs = [(6, 0, used_in.ids)]
+    @api.model
+    def _read_flow_rows(self, product_ids, date_from, date_to):
+        """Return the raw ``(product_id, company_id, warehouse_id, day, signed quantity)`` ledger rows of ``product_ids``, sales negative.
+
+        Only the rows dated from ``date_from`` and before ``date_to`` are read.
+        """
+        self.env['custom.calendar.ledger'].flush()
+        self.env.cr.execute("""
+            SELECT product_id, company_id, warehouse_id, date - %s, (CASE WHEN metric = 'sale_order_quantity' THEN -quantity ELSE quantity END)::float8
+            FROM custom_calendar_ledger
+            WHERE product_id IN %s AND date >= %s AND date < %s
+        """, (_EPOCH, tuple(product_ids), date_from, date_to))
+        return self.env.cr.fetchall()
 
-            _logger.info('Used In references: %s', record.used_in_refs)
+    @api.model
+    def _read_move_rows(self, product_ids, company_ids):
+        """Return the raw ``(product_id, company_id, warehouse_id, day, net quantity)`` rows of the pending moves entering or leaving stock.
+
+        Moves are assigned to the warehouse of their operation type, like the
+        ledger rows of their pickings.
+        """
+        self.env['stock.move'].flush(['product_id', 'product_qty', 'date', 'state', 'location_id', 'location_dest_id',
+                                      'company_id', 'picking_type_id'])
+        self.env.cr.execute("""
+            SELECT sm.product_id, sm.company_id, spt.warehouse_id, sm.date::date - %s,
+                   (CASE WHEN dest.usage = 'internal' THEN sm.product_qty ELSE -sm.product_qty END)::float8
+            FROM stock_move sm
+            JOIN stock_location src ON src.id = sm.location_id
+            JOIN stock_location dest ON dest.id = sm.location_dest_id
+            LEFT JOIN stock_picking_type spt ON spt.id = sm.picking_type_id
+            WHERE sm.product_id IN %s
+              AND sm.company_id IN %s
+              AND sm.state NOT IN ('draft', 'cancel', 'done')
+              AND (src.usage = 'internal') != (dest.usage = 'internal')
+        """, (_EPOCH, tuple(product_ids), tuple(company_ids)))
+        return self.env.cr.fetchall()
 
-    @api.depends('product_id', 'date')
-    def _compute_forecast_quantity(self):
-        for record in self:
-            if not record.product_id or not record.date:
-                record.forecast_quantity = 0.0
-                _logger.info("Computed forecast_quantity: 0.0 for product_id: %s on date: %s (product_id or date missing)", record.product_id.id, record.date)
-                continue
+    @api.model
+    def _project_cells(self, cells):
+        """Return ``(stock_on_hand, forecast_quantity, today_current_stock)`` lists aligned on the given cells.
+
+        Each ``(product_id, company_id, warehouse_id)`` site is projected as a
+        series of its own, opening on the stock of that company and
+        warehouse (of the whole company when the warehouse is None). The
+        ledger and pending move rows of the products are fetched raw for all
+        sites, in one query each, and aggregated by ``project_stock``,
+        vectorized with NumPy when it is installed.
+        """
+        if not cells:
+            return [], [], []
+        series, series_cells = {}, []
+        for product_id, company_id, warehouse_id, cell_date in cells:
+            index = series.setdefault((product_id, company_id, warehouse_id), len(series))
+            series_cells.append((index, (cell_date - _EPOCH).days))
+
+        products_by_site = defaultdict(list)
+        for product_id, company_id, warehouse_id in series:
+            products_by_site[company_id, warehouse_id].append(product_id)
+        openings = {}
+        for (company_id, warehouse_id), site_product_ids in products_by_site.items():
+            site = self.sudo().with_context(allowed_company_ids=[company_id], warehouse=warehouse_id)
+            for product_id, figures in site._get_stock_figures(site_product_ids).items():
+                openings[series[product_id, company_id, warehouse_id]] = figures[0]
+
+        def series_rows(rows):
+            return [(series[row[:3]], row[3], row[4]) for row in rows if row[:3] in series]
+
+        product_ids = list({key[0] for key in series})
+        today = fields.Date.context_today(self)
+        # flows before both today and the first cell cancel out of every projected figure
+        cell_dates = [cell[3] for cell in cells]
+        flows_from = min(min(cell_dates), today)
+        flows_to = max(max(cell_dates), today) + timedelta(days=1)
+        return project_stock(
+            series_cells,
+            openings,
+            series_rows(self._read_flow_rows(product_ids, flows_from, flows_to)),
+            series_rows(self._read_move_rows(product_ids, list({key[1] for key in series}))),
+            (today - _EPOCH).days,
+        )
+
+    @api.depends('product_id', 'company_id', 'warehouse_id', 'date', 'purchase_order_quantity', 'sale_order_quantity', 'being_manufactured')
+    @instrumented('CustomCalendarReport._compute_projection')
+    def _compute_projection(self):
+        """Project the per-day stock on hand and forecast of every row.
+
+        The current quantity on hand of each product is rolled forward and
+        backward from today over its daily flows, and its pending moves are
+        accumulated on top of it for the forecast.
+        """
+        records = self.filtered(lambda r: r.product_id and r.date)
+        (self - records).update(dict.fromkeys(_PROJECTION_FIELDS, 0.0))
+        if not records:
+            return
+
+        projection = self._project_cells([record._cell_key() for record in records])
+        for record, values in zip(records, zip(*projection)):
+            record.update(dict(zip(_PROJECTION_FIELDS, values)))
+
+        _logger.debug('Projected stock for %d report rows', len(records))
 
-            # Forecast based on virtual available
-            record.forecast_quantity = record.product_id.virtual_available or 0.0
+    @api.model
+    def _recompute_projection(self, product_ids):
+        """Recompute the projected stock of every cell of ``product_ids``. Returns the keys of these cells.
+
+        Cells are read and written back in bulk SQL, bypassing the ORM
+        compute of :meth:`_compute_projection`. The shortages of the
+        products are refreshed from the new projection.
+        """
+        if not product_ids:
+            return set()
+        self.flush()
+        self.env.cr.execute("""
+            SELECT id, product_id, company_id, warehouse_id, date FROM custom_calendar_report
+            WHERE product_id IN %s
+        """, (tuple(product_ids),))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            self.env['custom.calendar.shortage']._refresh(product_ids)
+            return set()
+        projection = self._project_cells([row[1:] for row in rows])
+        execute_values(self.env.cr._obj, """
+            UPDATE custom_calendar_report AS ccr
+            SET stock_on_hand = v.stock_on_hand, forecast_quantity = v.forecast_quantity, today_current_stock = v.today_current_stock
+            FROM (VALUES %s) AS v (id, stock_on_hand, forecast_quantity, today_current_stock)
+            WHERE ccr.id = v.id
+        """, [(row[0],) + values for row, values in zip(rows, zip(*projection))], page_size=1000)
+
+        reports = self.browse([row[0] for row in rows])
+        for fname in _PROJECTION_FIELDS:
+            self.env.remove_to_compute(self._fields[fname], reports)
+        reports.invalidate_cache(_PROJECTION_FIELDS)
+        self.env['custom.calendar.shortage']._refresh(product_ids)
+        return {row[1:] for row in rows}
 
-            _logger.info("Computed forecast_quantity: %s for product_id: %s on date: %s", record.forecast_quantity, record.product_id.id, record.date)
-    
-    @api.depends('date', 'stock_on_hand', 'purchase_order_quantity', 'sale_order_quantity', 'being_manufactured')
-    def _compute_today_current_stock(self):
-        for record in self:
-            stock_on_hand = record.stock_on_hand
-            purchase = record.purchase_order_quantity
-            sale = record.sale_order_quantity
-            being_manufactured = record.being_manufactured
+    @api.model
+    def _cron_refresh_projection(self, batch_size=500):
+        """Roll the projections forward to the new day and onto the latest quantities on hand."""
+        self.flush()
+        self.env.cr.execute('SELECT DISTINCT product_id FROM custom_calendar_report ORDER BY product_id')
+        product_ids = [row[0] for row in self.env.cr.fetchall()]
+        for index in range(0, len(product_ids), batch_size):
+            keys = self._recompute_projection(product_ids[index:index + batch_size])
+            self._notify_cells_changed(keys)
+            self.flush()
+            self.env.cr.commit()
+            self.env.clear()
 
-            # Compute today's current stock
-            record.today_current_stock = stock_on_hand + purchase - sale + being_manufactured
+    @api.model
+    def _window_query(self, date_from, date_to, columns, product_ids=None, warehouse_ids=None):
+        """Return the ``(query, params)`` selecting ``columns`` of the cells between ``date_from`` and ``date_to`` (inclusive).
+
+        Only the cells of the allowed companies are selected, optionally
+        narrowed to ``product_ids`` and ``warehouse_ids``, ordered by product,
+        site and date. Access rules apply.
+        """
+        self.check_access_rights('read')
+        self.flush(['product_id', 'company_id', 'warehouse_id', 'date'] + WINDOW_FIELDS)
+        domain = [('company_id', 'in', self.env.companies.ids), ('date', '>=', date_from), ('date', '<=', date_to)]
+        if warehouse_ids:
+            domain.append(('warehouse_id', 'in', list(warehouse_ids)))
+        if product_ids:
+            domain.append(('product_id', 'in', list(product_ids)))
+        query = self._search(domain, order='product_id, company_id, warehouse_id, date')
+        return query.select(*('"%s"."%s"' % (self._table, fname) for fname in columns))
+
+    @api.model
+    def _read_window(self, date_from, date_to, product_ids=None, warehouse_ids=None):
+        """Return the cells between ``date_from`` and ``date_to`` (inclusive) as a columnar payload.
+
+        Cells are selected by :meth:`_window_query`. Products are listed
+        once in ``products`` and rows refer to them by their index;
+        companies, warehouses and every metric are lists aligned on
+        ``dates``.
+        """
+        columns = ['product_id', 'date'] + WINDOW_FIELDS + ['company_id', 'warehouse_id']
+        self.env.cr.execute(*self._window_query(date_from, date_to, columns, product_ids, warehouse_ids))
+        rows = self.env.cr.fetchall()
+
+        product_index, products = {}, []
+        for row in rows:
+            if row[0] not in product_index:
+                product_index[row[0]] = len(products)
+                products.append(row[0])
+        names = dict(self.env['product.product'].browse(products).name_get())
+        payload = {
+            'date_from': fields.Date.to_string(date_from),
+            'date_to': fields.Date.to_string(date_to),
+            'products': {'ids': products, 'names': [names.get(product_id, '') for product_id in products]},
+            'product': [product_index[row[0]] for row in rows],
+            'dates': [fields.Date.to_string(row[1]) for row in rows],
+            'company': [row[-2] for row in rows],
+            'warehouse': [row[-1] for row in rows],
+        }
+        for index, fname in enumerate(WINDOW_FIELDS, start=2):
+            payload[fname] = [row[index] or 0.0 for row in rows]
+        return payload
 
-            _logger.info('Computed today_current_stock: %s for product_id: %s on date: %s', record.today_current_stock, record.product_id.id, record.date)
 
 class StockPicking(models.Model):
     _inherit = 'stock.picking'
 
-    @api.model
-    def create(self, vals):
-        # Create the StockPicking record first
-        record = super(StockPicking, self).create(vals)
-        _logger.info('Stock Picking created with ID: %s and values: %s', record.id, vals)
-        
-        # Immediately update the custom calendar report using the scheduled date
-        if record.scheduled_date:
-            _logger.info('Scheduled date set for Stock Picking ID: %s on creation: %s', record.id, record.scheduled_date)
-            record._update_custom_calendar_report()  # Trigger report update on creation
-        
-        return record
+    @api.model_create_multi
+    @instrumented('StockPicking.create')
+    def create(self, vals_list):
+        # Create the StockPicking records first, then queue the whole batch at once
+        pickings = super(StockPicking, self).create(vals_list)
+        log_event(self.env, 'picking.create', picking_ids=pickings.ids)
+        pickings._update_custom_calendar_report()
+        return pickings
 
+    @instrumented('StockPicking.write')
     def write(self, vals):
-        old_dates = {record.id: record.scheduled_date.date() if record.scheduled_date else False for record in self}
         res = super(StockPicking, self).write(vals)
-        _logger.info('Stock Picking with ID: %s updated with values: %s', self.id, vals)
-        
-        if 'scheduled_date' in vals:
-            for record in self:
-                old_date = old_dates.get(record.id)
-                new_date = record.scheduled_date.date() if record.scheduled_date else False
-                
-                # Log when a scheduled date is added
-                if not old_date and new_date:
-                    _logger.info('Scheduled date added for Picking ID: %s: %s', record.id, new_date)
-                
-                # Log if the scheduled date has changed
-                elif old_date and old_date != new_date:
-                    _logger.info('Scheduled date changed for Picking ID: %s from %s to %s', record.id, old_date, new_date)
-                    record._remove_old_custom_calendar_report(old_date)
-        
-        # Always update the custom calendar report after write
-        self._update_custom_calendar_report()
+        if _CALENDAR_PICKING_FIELDS.intersection(vals):
+            log_event(self.env, 'picking.write', picking_ids=self.ids, fields=lambda: ','.join(vals))
+            self._update_custom_calendar_report()
         return res
 
+    @instrumented('StockPicking.unlink')
     def unlink(self):
-        for record in self:
-            _logger.info('Stock Picking with ID: %s being unlinked.', record.id)
-            record._update_custom_calendar_report(remove=True)
-        result = super(StockPicking, self).unlink()
-        _logger.info('Stock Pickings unlinked.')
-        return result
+        log_event(self.env, 'picking.unlink', picking_ids=self.ids)
+        self._update_custom_calendar_report()
+        return super(StockPicking, self).unlink()
 
+    @instrumented('StockPicking.action_confirm')
     def action_confirm(self):
         """Confirm the stock picking, update stock quantities, and handle custom calendar reports."""
         res = super(StockPicking, self).action_confirm()
+        log_event(self.env, 'picking.confirm', picking_ids=self.ids)
 
         for picking in self:
-            _logger.info('Confirming Stock Picking(s): %s', picking.name)
-
             # Update stock quantities for each move line
             for move in picking.move_lines:
                 product = move.product_id
                 if picking.picking_type_id.code == 'incoming':
                     # For incoming pickings (e.g., receipt), increase stock
                     product.with_company(picking.company_id).qty_available += move.product_qty
-                    _logger.info('Received product: %s, quantity received: %s, new quantity: %s', product.name, move.product_qty, product.qty_available)
+                    log_event(self.env, 'picking.receive', product_id=product.id, quantity=move.product_qty, qty_available=lambda: product.qty_available)
                 elif picking.picking_type_id.code == 'outgoing':
                     # For outgoing pickings (e.g., delivery), decrease stock
                     product.with_company(picking.company_id).qty_available -= move.product_qty
-                    _logger.info('Shipped product: %s, quantity shipped: %s, new quantity: %s', product.name, move.product_qty, product.qty_available)
-
-            # Update custom calendar report
-            picking._update_custom_calendar_report()
+                    log_event(self.env, 'picking.ship', product_id=product.id, quantity=move.product_qty, qty_available=lambda: product.qty_available)
 
+        # Update custom calendar report
+        self._update_custom_calendar_report()
         return res
     
-    def _update_custom_calendar_report(self, remove=False):
-        for picking in self:
-            for move in picking.move_lines:
-                product_id = move.product_id.id
-                
-                # Ensure the scheduled date is set, default to today if missing
-                scheduled_date = picking.scheduled_date.date() if picking.scheduled_date else False
-                if not scheduled_date:
-                    scheduled_date = fields.Date.today()
-                    _logger.info('Scheduled date was missing, defaulting to today: %s', scheduled_date)
-
-                if scheduled_date:
-                    if remove:
-                        old_reports = self.env['custom.calendar.report'].search([
-                            ('product_id', '=', product_id),
-                            ('date', '=', scheduled_date)
-                        ])
-                        for report in old_reports:
-                            _logger.info('Removing quantities for report ID %s on date %s for product %s', report.id, scheduled_date, product_id)
-
-                            # Update quantities
-                            report.sale_order_quantity -= move.sale_line_id.product_uom_qty if move.sale_line_id else 0.0
-                            report.purchase_order_quantity -= move.purchase_line_id.product_qty if move.purchase_line_id else 0.0
-
-                            # Update references
-                            if move.sale_line_id:
-                                report.sale_order_refs = [(3, move.sale_line_id.order_id.id)]
-                            if move.purchase_line_id:
-                                report.purchase_order_refs = [(3, move.purchase_line_id.order_id.id)]
-
-                            # Unlink the report if all quantities are zero
-                            if not any([
-                                report.sale_order_quantity,
-                                report.purchase_order_quantity
-                            ]):
-                                _logger.info('Unlinking report ID %s as all quantities are zero', report.id)
-                                report.unlink()
-                            else:
-                                _logger.info('Updated report ID %s with remaining quantities', report.id)
-                    else:
-                        report = self.env['custom.calendar.report'].search([
-                            ('product_id', '=', product_id),
-                            ('date', '=', scheduled_date)
-                        ], limit=1)
-                        
-                        if not report:
-                            # Create a new report entry if it doesn't exist
-                            report = self.env['custom.calendar.report'].create({
-                                'product_id': product_id,
-                                'date': scheduled_date,
-                                'sale_order_quantity': move.sale_line_id.product_uom_qty if move.sale_line_id else 0.0,
-                                'purchase_order_quantity': move.purchase_line_id.product_qty if move.purchase_line_id else 0.0,
-                                'sale_order_refs': [(4, move.sale_line_id.order_id.id)] if move.sale_line_id else [],
-                                'purchase_order_refs': [(4, move.purchase_line_id.order_id.id)] if move.purchase_line_id else [],
-                            })
-                            _logger.info('Created new report ID %s for product %s on date %s', report.id, product_id, scheduled_date)
-                        else:
-                            _logger.info('Updating existing report ID %s for product %s on date %s', report.id, product_id, scheduled_date)
-                            
-                            # Update quantities in the existing report
-                            report.sale_order_quantity += move.sale_line_id.product_uom_qty if move.sale_line_id else 0.0
-                            report.purchase_order_quantity += move.purchase_line_id.product_qty if move.purchase_line_id else 0.0
-
-                            # Add references to the report
-                            if move.sale_line_id:
-                                report.sale_order_refs = [(4, move.sale_line_id.order_id.id)]
-                            if move.purchase_line_id:
-                                report.purchase_order_refs = [(4, move.purchase_line_id.order_id.id)]
-
-    def _remove_old_custom_calendar_report(self, old_date):
+    def _custom_calendar_ledger_entries(self):
+        """Return the calendar ledger rows of these pickings, one per (picking, product, date, metric)."""
+        entries = {}
         for picking in self:
+            if not picking.scheduled_date or picking.state == 'cancel' or picking.picking_type_id.code not in ('incoming', 'outgoing'):
+                continue
+            date = picking.scheduled_date.date()
+            seen_lines = set()
             for move in picking.move_lines:
-                product_id = move.product_id.id
-                if old_date:
-                    old_reports = self.env['custom.calendar.report'].search([
-                        ('product_id', '=', product_id),
-                        ('date', '=', old_date)
-                    ])
-                    for report in old_reports:
-                        _logger.info('Processing old report ID %s for product %s on date %s', report.id, product_id, old_date)
-                        report.sale_order_quantity -= move.sale_line_id.product_uom_qty if move.sale_line_id else 0.0
-                        report.purchase_order_quantity -= move.purchase_line_id.product_qty if move.purchase_line_id else 0.0
-
-                        if move.sale_line_id:
-                            report.sale_order_refs = [(3, move.sale_line_id.order_id.id)]
-                        if move.purchase_line_id:
-                            report.purchase_order_refs = [(3, move.purchase_line_id.order_id.id)]
-
-                        if not any([
-                            report.sale_order_quantity,
-                            report.purchase_order_quantity
-                        ]):
-                            _logger.info('Unlinking report ID %s for product %s on old date %s as quantities are zero', report.id, product_id, old_date)
-                            report.unlink()
-                        else:
-                            _logger.info('Updated old report ID %s with remaining quantities', report.id)
+                for metric, line, quantity in (
+                    ('sale_order_quantity', move.sale_line_id, move.sale_line_id.product_uom_qty),
+                    ('purchase_order_quantity', move.purchase_line_id, move.purchase_line_id.product_qty),
+                ):
+                    if not line or line in seen_lines:
+                        continue
+                    seen_lines.add(line)
+                    entry = entries.setdefault((picking.id, move.product_id.id, metric), {
+                        'res_model': self._name,
+                        'res_id': picking.id,
+                        'product_id': move.product_id.id,
+                        'company_id': picking.company_id.id,
+                        'warehouse_id': picking.picking_type_id.warehouse_id.id or None,
+                        'date': date,
+                        'metric': metric,
+                        'quantity': 0.0,
+                        'ref_model': line.order_id._name,
+                        'ref_id': line.order_id.id,
+                    })
+                    entry['quantity'] += quantity
+        return list(entries.values())
+
+    def _update_custom_calendar_report(self):
+        """Queue these pickings for ledger syncing and their calendar cells for recomputation."""
+        self.env['custom.calendar.report']._mark_dirty(documents=self)
 
 
 class MrpProduction(models.Model):
     _inherit = 'mrp.production'
 
-    @api.model
-    def create(self, vals):
-        """Create a new manufacturing order and update the custom calendar report."""
-        record = super(MrpProduction, self).create(vals)
-        _logger.info('Manufacturing Order created with ID: %s and values: %s', record.id, vals)
-        # Update custom calendar report
-        record._update_custom_calendar_report()
-        return record
+    @api.model_create_multi
+    @instrumented('MrpProduction.create')
+    def create(self, vals_list):
+        """Create manufacturing orders and queue the whole batch for the custom calendar report."""
+        productions = super(MrpProduction, self).create(vals_list)
+        log_event(self.env, 'production.create', production_ids=productions.ids)
+        productions._update_custom_calendar_report()
+        return productions
 
+    @instrumented('MrpProduction.write')
     def write(self, vals):
-        """Update an existing manufacturing order and handle changes to the planned start date."""
-        # Capture old dates before update
-        old_dates = {record.id: record.date_planned_start.date() if record.date_planned_start else False for record in self}
+        """Update existing manufacturing orders and queue their calendar contributions for syncing."""
         res = super(MrpProduction, self).write(vals)
-        _logger.info('Manufacturing Order with ID: %s updated with values: %s', self.id, vals)
-
-        # Process date changes
-        if 'date_planned_start' in vals:
-            for record in self:
-                old_date = old_dates.get(record.id)
-                new_date = record.date_planned_start.date() if record.date_planned_start else False
-                if old_date and old_date != new_date:
-                    _logger.info('Planned start date changed for Manufacturing Order ID: %s from %s to %s', record.id, old_date, new_date)
-                    record._remove_old_custom_calendar_report(old_date)
-                    record._update_custom_calendar_report()  # Update with new date
+        if _CALENDAR_PRODUCTION_FIELDS.intersection(vals):
+            log_event(self.env, 'production.write', production_ids=self.ids, fields=lambda: ','.join(vals))
+            self._update_custom_calendar_report()
         return res
 
+    @instrumented('MrpProduction.unlink')
     def unlink(self):
         """Unlink (delete) manufacturing orders and update the custom calendar report."""
-        for record in self:
-            _logger.info('Manufacturing Order with ID: %s being unlinked.', record.id)
-            record._update_custom_calendar_report(remove=True)
-        result = super(MrpProduction, self).unlink()
-        _logger.info('Manufacturing Orders unlinked.')
-        return result
+        log_event(self.env, 'production.unlink', production_ids=self.ids)
+        self._update_custom_calendar_report()
+        return super(MrpProduction, self).unlink()
 
+    @instrumented('MrpProduction.action_confirm')
     def action_confirm(self):
         """Confirm the manufacturing order, update stock quantities, and handle custom calendar reports."""
         # Call the original action_confirm method
         res = super(MrpProduction, self).action_confirm()
+        log_event(self.env, 'production.confirm', production_ids=self.ids)
 
         for production in self:
-            _logger.info('Confirming Manufacturing Order(s): %s', production.name)
-
             # Update raw materials
             for move in production.move_raw_ids:
                 product = move.product_id
                 product.with_company(production.company_id).qty_available -= move.product_uom_qty
-                _logger.info('Consumed raw material: %s, quantity consumed: %s, new quantity: %s', product.name, move.product_uom_qty, product.qty_available)
+                log_event(self.env, 'production.consume', product_id=product.id, quantity=move.product_uom_qty, qty_available=lambda: product.qty_available)
 
             # Update finished products
             for move in production.move_finished_ids:
                 product = move.product_id
                 product.with_company(production.company_id).qty_available += move.product_uom_qty
-                _logger.info('Produced finished product: %s, quantity produced: %s, new quantity: %s', product.name, move.product_uom_qty, product.qty_available)
-
-            # Update custom calendar report
-            production._update_custom_calendar_report()
+                log_event(self.env, 'production.produce', product_id=product.id, quantity=move.product_uom_qty, qty_available=lambda: product.qty_available)
 
+        # Update custom calendar report
+        self._update_custom_calendar_report()
         return res
 
     
-    def _update_custom_calendar_report(self, remove=False):
-        """Update or remove entries in the custom calendar report based on the manufacturing order."""
-        for production in self:
-            product_id = production.product_id.id
-            planned_start_date = production.date_planned_start.date() if production.date_planned_start else False
-            if planned_start_date:
-                if remove:
-                    # Remove or update existing report entries
-                    old_reports = self.env['custom.calendar.report'].search([
-                        ('product_id', '=', product_id),
-                        ('date', '=', planned_start_date)
-                    ])
-                    for report in old_reports:
-                        _logger.info('Removing quantities from report ID %s for product %s on date %s', report.id, product_id, planned_start_date)
-                        report.being_manufactured -= production.product_qty
-                        if not report.being_manufactured:
-                            report.manufacturing_order_refs = [(3, production.id)]  # Remove reference
-                        if not any([
-                            report.sale_order_quantity,
-                            report.purchase_order_quantity,
-                            report.being_manufactured
-                        ]):
-                            _logger.info('Unlinking report ID %s as all quantities are zero', report.id)
-                            report.unlink()  # Delete the report if no relevant data
-                        else:
-                            _logger.info('Updated report ID %s with remaining quantities', report.id)
-                else:
-                    # Create or update report entry
-                    report = self.env['custom.calendar.report'].search([
-                        ('product_id', '=', product_id),
-                        ('date', '=', planned_start_date)
-                    ], limit=1)
-                    if not report:
-                        # Create new report
-                        report = self.env['custom.calendar.report'].create({
-                            'product_id': product_id,
-                            'date': planned_start_date,
-                            'being_manufactured': production.product_qty,
-                            'manufacturing_order_refs': [(4, production.id)]  # Add reference
-                        })
-                        _logger.info('Created new report ID %s for product %s on date %s', report.id, product_id, planned_start_date)
-                    else:
-                        # Update existing report
-                        _logger.info('Updating existing report ID %s for product %s on date %s', report.id, product_id, planned_start_date)
-                        report.being_manufactured += production.product_qty
-                        if production.id not in report.manufacturing_order_refs.ids:
-                            report.manufacturing_order_refs = [(4, production.id)]  # Add reference
-
-                    # Remove reference and quantity from the old report (if date changed)
-                    old_report = self.env['custom.calendar.report'].search([
-                        ('product_id', '=', product_id),
-                        ('date', '=', production.date_planned_start.date() if production.date_planned_start else False)  # Use original planned_start_date
-                    ], limit=1)
-                    if old_report and old_report.id != report.id:  # Avoid removing from the current report
-                        _logger.info('Updating old report ID %s for product %s on old date %s', old_report.id, product_id, production.date_planned_start.date())
-                        old_report.being_manufactured -= production.product_qty
-                        old_report.manufacturing_order_refs = [(3, production.id)]
-                        if not any([
-                            old_report.sale_order_quantity,
-                            old_report.purchase_order_quantity,
-                            old_report.being_manufactured
-                        ]):
-                            _logger.info('Unlinking old report ID %s as all quantities are zero', old_report.id)
-                            old_report.unlink()  # Delete the report if no relevant data
-                        else:
-                            _logger.info('Updated old report ID %s with remaining quantities', old_report.id)
-
-    def _remove_old_custom_calendar_report(self, old_date):
-        """Remove or update custom calendar report entries associated with the old date."""
-        for production in self:
-            product_id = production.product_id.id
-            if old_date:
-                old_reports = self.env['custom.calendar.report'].search([
-                    ('product_id', '=', product_id),
-                    ('date', '=', old_date)
-                ])
-                for report in old_reports:
-                    _logger.info('Processing old report ID %s for product %s on date %s', report.id, product_id, old_date)
-                    report.being_manufactured -= production.product_qty
-                    if not report.being_manufactured:
-                        report.manufacturing_order_refs = [(3, production.id)]  # Remove reference
-                    if not any([
-                        report.sale_order_quantity,
-                        report.purchase_order_quantity,
-                        report.being_manufactured
-                    ]):
-                        _logger.info('Unlinking old report ID %s as all quantities are zero', report.id)
-                        report.unlink()  # Delete the report if no relevant data
+    def _custom_calendar_ledger_entries(self):
+        """Return the calendar ledger rows of these manufacturing orders."""
+        return [{
+            'res_model': self._name,
+            'res_id': production.id,
+            'product_id': production.product_id.id,
+            'company_id': production.company_id.id,
+            'warehouse_id': production.picking_type_id.warehouse_id.id or None,
+            'date': production.date_planned_start.date(),
+            'metric': 'being_manufactured',
+            'quantity': production.product_qty,
+            'ref_model': self._name,
+            'ref_id': production.id,
+        } for production in self if production.date_planned_start]
+
+    def _update_custom_calendar_report(self):
+        """Queue these manufacturing orders for ledger syncing and their calendar cells for recomputation."""
+        self.env['custom.calendar.report']._mark_dirty(documents=self)
+
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super(StockQuant, self).create(vals_list)
+        self.env['custom.calendar.report']._invalidate_stock_figures(quants.mapped('product_id').ids)
+        return quants
+
+    def write(self, vals):
+        # invalidated once written, so figures read during the write are not cached with the old quantity
+        product_ids = self.mapped('product_id').ids
+        res = super(StockQuant, self).write(vals)
+        self.env['custom.calendar.report']._invalidate_stock_figures(product_ids + self.mapped('product_id').ids)
+        return res
 
+    def unlink(self):
+        product_ids = self.mapped('product_id').ids
+        res = super(StockQuant, self).unlink()
+        self.env['custom.calendar.report']._invalidate_stock_figures(product_ids)
+        return res
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    # Moves drive the incoming/outgoing part of virtual_available
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super(StockMove, self).create(vals_list)
+        self.env['custom.calendar.report']._invalidate_stock_figures(moves.mapped('product_id').ids)
+        return moves
+
+    def write(self, vals):
+        if not {'state', 'product_uom_qty', 'product_id', 'location_id', 'location_dest_id'}.intersection(vals):
+            return super(StockMove, self).write(vals)
+        old_products = self.mapped('product_id')
+        res = super(StockMove, self).write(vals)
+        self.env['custom.calendar.report']._invalidate_stock_figures((old_products | self.mapped('product_id')).ids)
+        return res
+
+
+class MrpBom(models.Model):
+    _inherit = 'mrp.bom'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        boms = super(MrpBom, self).create(vals_list)
+        self.env['custom.calendar.bom.index']._mark_dirty(boms)
+        return boms
+
+    def write(self, vals):
+        # products of the BoM before the write are affected as well
+        self.env['custom.calendar.bom.index']._mark_dirty(self)
+        res = super(MrpBom, self).write(vals)
+        self.env['custom.calendar.bom.index']._mark_dirty(self)
+        return res
+
+    def unlink(self):
+        self.env['custom.calendar.bom.index']._mark_dirty(self)
+        return super(MrpBom, self).unlink()
+
+
+class MrpBomLine(models.Model):
+    _inherit = 'mrp.bom.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super(MrpBomLine, self).create(vals_list)
+        self.env['custom.calendar.bom.index']._mark_dirty(lines.mapped('bom_id'))
+        return lines
+
+    def write(self, vals):
+        self.env['custom.calendar.bom.index']._mark_dirty(self.mapped('bom_id'))
+        res = super(MrpBomLine, self).write(vals)
+        self.env['custom.calendar.bom.index']._mark_dirty(self.mapped('bom_id'))
+        return res
+
+    def unlink(self):
+        self.env['custom.calendar.bom.index']._mark_dirty(self.mapped('bom_id'))
+        return super(MrpBomLine, self).unlink()
 
 
 class PurchaseOrder(models.Model):
@@ -517,17 +966,16 @@ class PurchaseOrder(models.Model):
         res = super(PurchaseOrder, self).button_confirm()
 
         for order in self:
-            _logger.info('Confirming Purchase Order(s): %s', order.mapped('name'))
+            log_event(self.env, 'purchase.confirm', order_id=order.id)
             for picking in order.picking_ids:
                 # Update stock on hand for each picking in the purchase order
                 for move_line in picking.move_lines:
                     product = move_line.product_id
                     product.with_company(order.company_id).qty_available += move_line.product_qty
-                    _logger.info('Updated stock on hand for product: %s, new quantity: %s', product.name, product.qty_available)
-                
-                # Trigger the update of the custom calendar report
-                picking._update_custom_calendar_report()
+                    log_event(self.env, 'purchase.receive', product_id=product.id, quantity=move_line.product_qty, qty_available=lambda: product.qty_available)
 
+        # Trigger the update of the custom calendar report
+        self.mapped('picking_ids')._update_custom_calendar_report()
         return res
 
 
@@ -536,11 +984,11 @@ class SaleOrder(models.Model):
     _inherit = 'sale.order'
 
     def action_confirm(self):
-        _logger.info('Confirming Sale Order(s): %s', self.mapped('name'))
+        log_event(self.env, 'sale.confirm', order_ids=self.ids)
         res = super(SaleOrder, self).action_confirm()
         for order in self:
             for line in order.order_line:
                 product = line.product_id
                 product.with_company(order.company_id).qty_available -= line.product_uom_qty
-                _logger.info('Updated stock on hand for product: %s, new quantity: %s', product.name, product.qty_available)
+                log_event(self.env, 'sale.ship', product_id=product.id, quantity=line.product_uom_qty, qty_available=lambda: product.qty_available)
         return res
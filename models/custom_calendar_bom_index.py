@@ -0,0 +1,172 @@
+from odoo import models, fields, api, tools
+from psycopg2.extras import execute_values
+from collections import defaultdict
+import logging
+
+from ..tools.calendar_log import log_batch
+
+_logger = logging.getLogger(__name__)
+
+# Explosion depth limit, guards against pathological BoM structures
+_MAX_LEVEL = 20
+
+# Key of the per-transaction set of parent products to re-explode
+_DIRTY_PARENTS = 'custom.calendar.bom.index.dirty'
+
+
+class CustomCalendarBomIndex(models.Model):
+    _name = 'custom.calendar.bom.index'
+    _description = 'Custom Calendar BoM Index'
+    _log_access = False
+    _order = 'parent_product_id, level, id'
+
+    parent_product_id = fields.Many2one('product.product', string='Product', required=True, ondelete='cascade')
+    component_id = fields.Many2one('product.product', string='Component', required=True, ondelete='cascade')
+    bom_id = fields.Many2one('mrp.bom', string='BoM', required=True, ondelete='cascade')
+    level = fields.Integer(string='Level', required=True,
+                           help='0 for the BoMs of the product itself, 1 for direct components, 2 for their components, etc.')
+    quantity = fields.Float(string='Quantity', help='Component quantity needed for one unit of the product.')
+
+    _sql_constraints = [
+        ('path_uniq', 'unique(parent_product_id, component_id, bom_id, level)', 'BoM index rows must be unique.'),
+    ]
+
+    def init(self):
+        tools.create_index(self._cr, 'custom_calendar_bom_index_component_index', self._table, ['component_id', 'level'])
+
+    @api.model
+    def _affected_parents(self, boms):
+        """Return the ids of the products whose explosion goes through ``boms`` or their products."""
+        variants = boms.mapped('product_id') | boms.filtered(lambda b: not b.product_id).mapped('product_tmpl_id.product_variant_ids')
+        parent_ids = set(variants.ids)
+        if boms or variants:
+            self.flush()
+            self.env.cr.execute("""
+                SELECT DISTINCT parent_product_id FROM custom_calendar_bom_index
+                WHERE bom_id IN %s OR component_id IN %s
+            """, (tuple(boms.ids) or (None,), tuple(variants.ids) or (None,)))
+            parent_ids.update(row[0] for row in self.env.cr.fetchall())
+        return parent_ids
+
+    @api.model
+    def _mark_dirty(self, boms):
+        """Queue the products affected by ``boms`` for re-explosion at the end of the transaction.
+
+        Affected products are collected right away, so that unlinked BoMs are
+        still found through their index rows.
+        """
+        parent_ids = self._affected_parents(boms)
+        if not parent_ids:
+            return
+        data = self.env.cr.precommit.data
+        if _DIRTY_PARENTS not in data:
+            data[_DIRTY_PARENTS] = set()
+            self.env.cr.precommit.add(self.sudo()._flush_dirty)
+        data[_DIRTY_PARENTS].update(parent_ids)
+
+    def _flush_dirty(self):
+        parent_ids = self.env.cr.precommit.data.pop(_DIRTY_PARENTS, set())
+        if parent_ids:
+            self._rebuild(parent_ids)
+            self.flush()
+
+    @api.model
+    def _main_boms(self, products):
+        """Return ``{product_id: bom}`` with the BoM used to manufacture each product, following ``mrp.bom._bom_find()`` priorities."""
+        boms = self.env['mrp.bom'].search([
+            ('product_tmpl_id', 'in', products.mapped('product_tmpl_id').ids),
+            ('type', 'in', ('normal', 'phantom')),
+        ])
+        # variant specific BoMs first, then by sequence
+        boms = boms.sorted(lambda b: (b.sequence, not b.product_id, b.id))
+        main_boms = {}
+        for product in products:
+            for bom in boms:
+                if bom.product_tmpl_id == product.product_tmpl_id and bom.product_id in (product, self.env['product.product']):
+                    main_boms[product.id] = bom
+                    break
+        return main_boms
+
+    @api.model
+    def _explode(self, products):
+        """Return the index rows of ``products`` as ``{(parent_id, component_id, bom_id, level): quantity}``.
+
+        The explosion is done level by level for all products at once, with
+        one BoM search per level.
+        """
+        rows = defaultdict(float)
+        for bom in self.env['mrp.bom'].search([('product_tmpl_id', 'in', products.mapped('product_tmpl_id').ids)]):
+            for product in products:
+                if bom.product_tmpl_id == product.product_tmpl_id and bom.product_id in (product, self.env['product.product']):
+                    rows[(product.id, product.id, bom.id, 0)] += bom.product_qty
+
+        # (root product id, product to explode, quantity per root unit, products on the path)
+        frontier = [(product.id, product, 1.0, frozenset([product.id])) for product in products]
+        level = 1
+        while frontier and level <= _MAX_LEVEL:
+            main_boms = self._main_boms(self.env['product.product'].union(*[product for __, product, __, __ in frontier]))
+            next_frontier = []
+            for root_id, product, quantity, path in frontier:
+                bom = main_boms.get(product.id)
+                if not bom:
+                    continue
+                factor = quantity / (bom.product_uom_id._compute_quantity(bom.product_qty, product.uom_id) or 1.0)
+                for line in bom.bom_line_ids:
+                    component = line.product_id
+                    if line._skip_bom_line(product) or component.id in path:
+                        continue
+                    line_quantity = line.product_uom_id._compute_quantity(line.product_qty, component.uom_id) * factor
+                    rows[(root_id, component.id, bom.id, level)] += line_quantity
+                    next_frontier.append((root_id, component, line_quantity, path | {component.id}))
+            frontier = next_frontier
+            level += 1
+        return rows
+
+    @api.model
+    def _rebuild(self, parent_ids=None):
+        """Re-explode ``parent_ids`` (every manufactured product when None) and refresh the BoM data of their cells."""
+        with log_batch('calendar.bom_index_rebuild', products=len(parent_ids) if parent_ids is not None else 'all') as summary:
+            summary['rows'] = self._rebuild_rows(parent_ids)
+
+    def _rebuild_rows(self, parent_ids):
+        self.flush()
+        if parent_ids is None:
+            boms = self.env['mrp.bom'].search([])
+            products = boms.mapped('product_id') | boms.filtered(lambda b: not b.product_id).mapped('product_tmpl_id.product_variant_ids')
+            self.env.cr.execute('SELECT DISTINCT component_id FROM custom_calendar_bom_index')
+            old_component_ids = {row[0] for row in self.env.cr.fetchall()}
+            self.env.cr.execute('DELETE FROM custom_calendar_bom_index')
+        else:
+            products = self.env['product.product'].browse(list(parent_ids)).exists()
+            self.env.cr.execute("""
+                DELETE FROM custom_calendar_bom_index WHERE parent_product_id IN %s RETURNING component_id
+            """, (tuple(parent_ids),))
+            old_component_ids = {row[0] for row in self.env.cr.fetchall()}
+
+        rows = self._explode(products) if products else {}
+        if rows:
+            execute_values(self.env.cr._obj, """
+                INSERT INTO custom_calendar_bom_index (parent_product_id, component_id, bom_id, level, quantity)
+                VALUES %s
+            """, [key + (quantity,) for key, quantity in rows.items()])
+        self.invalidate_cache()
+
+        touched_ids = old_component_ids | {component_id for __, component_id, __, __ in rows} | set(products.ids)
+        self.env['custom.calendar.report']._recompute_bom_fields(touched_ids)
+        _logger.debug('Rebuilt the BoM index of %d products: %d rows', len(products), len(rows))
+        return len(rows)
+
+    @api.model
+    def _read_used_in(self, product_ids):
+        """Return ``{component_id: [(parent_id, level, quantity)]}`` for ``product_ids`` across all levels."""
+        self.flush()
+        self.env.cr.execute("""
+            SELECT component_id, parent_product_id, level, sum(quantity)
+            FROM custom_calendar_bom_index
+            WHERE component_id IN %s AND level > 0
+            GROUP BY component_id, parent_product_id, level
+        """, (tuple(product_ids),))
+        used_in = defaultdict(list)
+        for component_id, parent_id, level, quantity in self.env.cr.fetchall():
+            used_in[component_id].append((parent_id, level, quantity or 0.0))
+        return used_in
@@ -0,0 +1,172 @@
+from odoo import models, fields, api, tools
+from datetime import timedelta
+from psycopg2.extras import execute_values
+import logging
+
+from ..tools.calendar_log import log_batch
+from ..tools.calendar_perf import instrumented
+
+_logger = logging.getLogger(__name__)
+
+# Ledger metric -> report many2many field listing the referenced documents
+LEDGER_METRICS = {
+    'sale_order_quantity': 'sale_order_refs',
+    'purchase_order_quantity': 'purchase_order_refs',
+    'being_manufactured': 'manufacturing_order_refs',
+}
+
+
+class CustomCalendarLedger(models.Model):
+    _name = 'custom.calendar.ledger'
+    _description = 'Custom Calendar Ledger'
+    _log_access = False
+    _order = 'date, id'
+
+    res_model = fields.Char(string='Source Model', required=True)
+    res_id = fields.Integer(string='Source ID', required=True)
+    product_id = fields.Many2one('product.product', string='Product', required=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade')
+    warehouse_id = fields.Many2one('stock.warehouse', string='Warehouse', ondelete='cascade')
+    date = fields.Date(string='Date', required=True)
+    metric = fields.Selection([
+        ('sale_order_quantity', 'Sale Order Quantity'),
+        ('purchase_order_quantity', 'Purchase Order Quantity'),
+        ('being_manufactured', 'Being Manufactured'),
+    ], string='Metric', required=True)
+    quantity = fields.Float(string='Quantity')
+    ref_model = fields.Char(string='Reference Model')
+    ref_id = fields.Integer(string='Reference ID')
+
+    _sql_constraints = [
+        ('document_cell_metric_uniq', 'unique(res_model, res_id, product_id, date, metric)',
+         'A source document can only contribute once per product, date and metric.'),
+    ]
+
+    def init(self):
+        tools.create_index(self._cr, 'custom_calendar_ledger_product_date_index', self._table, ['product_id', 'company_id', 'warehouse_id', 'date'])
+
+    @api.model
+    @instrumented('CustomCalendarLedger._sync_documents')
+    def _sync_documents(self, records):
+        """Replace the ledger rows of ``records`` by their current contributions.
+
+        Deleted records simply lose their rows, so the operation is idempotent
+        and a date change is a delete-plus-insert of the document's rows.
+        Returns the ``(product_id, company_id, warehouse_id, date)`` cells
+        whose totals may have changed.
+        """
+        if not records:
+            return set()
+        self.flush()
+        self.env.cr.execute("""
+            DELETE FROM custom_calendar_ledger
+            WHERE res_model = %s AND res_id IN %s
+            RETURNING product_id, company_id, warehouse_id, date
+        """, (records._name, tuple(records.ids)))
+        keys = set(self.env.cr.fetchall())
+        # days before the archive cutoff are folded into opening balances: changes no longer reach them
+        cutoff = self.env['custom.calendar.report']._archive_cutoff()
+        entries = [
+            entry for entry in records.exists()._custom_calendar_ledger_entries()
+            if not cutoff or entry['date'] >= cutoff
+        ]
+        self._insert_entries(entries)
+        keys.update((entry['product_id'], entry['company_id'], entry['warehouse_id'], entry['date']) for entry in entries)
+        _logger.debug('Synced %d ledger rows for %d %s records', len(entries), len(records), records._name)
+        return keys
+
+    @api.model
+    def _insert_entries(self, entries):
+        if not entries:
+            return
+        execute_values(self.env.cr._obj, """
+            INSERT INTO custom_calendar_ledger (res_model, res_id, product_id, company_id, warehouse_id, date, metric, quantity, ref_model, ref_id)
+            VALUES %s
+            ON CONFLICT (res_model, res_id, product_id, date, metric) DO UPDATE SET
+                company_id = EXCLUDED.company_id,
+                warehouse_id = EXCLUDED.warehouse_id,
+                quantity = EXCLUDED.quantity,
+                ref_model = EXCLUDED.ref_model,
+                ref_id = EXCLUDED.ref_id
+        """, [(
+            entry['res_model'], entry['res_id'], entry['product_id'], entry['company_id'], entry['warehouse_id'], entry['date'], entry['metric'],
+            entry['quantity'], entry.get('ref_model'), entry.get('ref_id'),
+        ) for entry in entries])
+        self.invalidate_cache()
+
+    @api.model
+    def _read_totals(self, product_ids, date_from, date_to):
+        """Return ``{(product_id, company_id, warehouse_id, date): {metric: quantity}}`` summed from the ledger."""
+        self.flush()
+        self.env.cr.execute("""
+            SELECT product_id, company_id, warehouse_id, date, metric, sum(quantity)
+            FROM custom_calendar_ledger
+            WHERE product_id IN %s AND date >= %s AND date <= %s
+            GROUP BY product_id, company_id, warehouse_id, date, metric
+        """, (tuple(product_ids), date_from, date_to))
+        totals = {}
+        for product_id, company_id, warehouse_id, date, metric, quantity in self.env.cr.fetchall():
+            totals.setdefault((product_id, company_id, warehouse_id, date), {})[metric] = quantity or 0.0
+        return totals
+
+    @api.model
+    def _read_refs(self, product_ids, date_from, date_to):
+        """Return ``{(product_id, company_id, warehouse_id, date): {metric: ref ids}}``, the documents referenced by each cell."""
+        self.flush()
+        self.env.cr.execute("""
+            SELECT product_id, company_id, warehouse_id, date, metric, array_agg(DISTINCT ref_id)
+            FROM custom_calendar_ledger
+            WHERE product_id IN %s AND date >= %s AND date <= %s AND ref_id IS NOT NULL
+            GROUP BY product_id, company_id, warehouse_id, date, metric
+        """, (tuple(product_ids), date_from, date_to))
+        refs = {}
+        for product_id, company_id, warehouse_id, date, metric, ref_ids in self.env.cr.fetchall():
+            refs.setdefault((product_id, company_id, warehouse_id, date), {})[metric] = ref_ids
+        return refs
+
+    @api.model
+    def _compact(self, cutoff):
+        """Fold the rows dated before ``cutoff`` into one opening-balance row per product, site and metric.
+
+        Opening rows are dated the day before ``cutoff`` and belong to their
+        site (its warehouse, else its company) rather than to a document.
+        Projections only read the flows from their first projected day on,
+        so the older rows are never read one by one again.
+        """
+        self.flush()
+        with log_batch('calendar.compact_ledger', cutoff=cutoff) as summary:
+            self.env.cr.execute("""
+                WITH folded AS (
+                    DELETE FROM custom_calendar_ledger WHERE date < %(cutoff)s
+                    RETURNING product_id, company_id, warehouse_id, metric, quantity
+                )
+                INSERT INTO custom_calendar_ledger (res_model, res_id, product_id, company_id, warehouse_id, date, metric, quantity)
+                SELECT CASE WHEN warehouse_id IS NULL THEN 'res.company' ELSE 'stock.warehouse' END,
+                       COALESCE(warehouse_id, company_id), product_id, company_id, warehouse_id, %(opening)s, metric, sum(quantity)
+                FROM folded
+                GROUP BY product_id, company_id, warehouse_id, metric
+            """, {'cutoff': cutoff, 'opening': cutoff - timedelta(days=1)})
+            summary['rows'] = self.env.cr.rowcount
+        self.invalidate_cache()
+
+    @api.model
+    def _rebuild_cells(self, product_ids=None, date_from=None, date_to=None):
+        """Re-derive the calendar cells of the given products and/or dates from the ledger alone."""
+        where, params = ['TRUE'], []
+        if product_ids:
+            where.append('product_id IN %s')
+            params.append(tuple(product_ids))
+        if date_from:
+            where.append('date >= %s')
+            params.append(date_from)
+        if date_to:
+            where.append('date <= %s')
+            params.append(date_to)
+        self.flush()
+        self.env.cr.execute("""
+            SELECT product_id, company_id, warehouse_id, date FROM custom_calendar_ledger WHERE {where}
+            UNION
+            SELECT product_id, company_id, warehouse_id, date FROM custom_calendar_report WHERE {where}
+        """.format(where=' AND '.join(where)), params * 2)
+        keys = set(self.env.cr.fetchall())
+        return self.env['custom.calendar.report']._recompute_cells(keys)
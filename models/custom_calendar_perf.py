@@ -0,0 +1,67 @@
+from odoo import models, fields, api
+
+from ..tools.calendar_perf import flush_stats
+
+
+class CustomCalendarPerfStat(models.Model):
+    _name = 'custom.calendar.perf.stat'
+    _description = 'Custom Calendar Performance Statistics'
+    _log_access = False
+    _rec_name = 'method'
+    _order = 'day desc, total_ms desc'
+
+    method = fields.Char(string='Method', required=True, readonly=True)
+    day = fields.Date(string='Day', required=True, readonly=True)
+    calls = fields.Integer(string='Calls', readonly=True)
+    total_ms = fields.Float(string='Total (ms)', readonly=True)
+    avg_ms = fields.Float(string='Average (ms)', compute='_compute_averages')
+    max_ms = fields.Float(string='Max (ms)', readonly=True, group_operator='max')
+    sql_count = fields.Integer(string='SQL Queries', readonly=True)
+    avg_sql_count = fields.Float(string='Average SQL Queries', compute='_compute_averages')
+    bucket_le_1 = fields.Integer(string='<= 1 ms', readonly=True)
+    bucket_le_10 = fields.Integer(string='<= 10 ms', readonly=True)
+    bucket_le_50 = fields.Integer(string='<= 50 ms', readonly=True)
+    bucket_le_100 = fields.Integer(string='<= 100 ms', readonly=True)
+    bucket_le_500 = fields.Integer(string='<= 500 ms', readonly=True)
+    bucket_le_1000 = fields.Integer(string='<= 1 s', readonly=True)
+    bucket_gt_1000 = fields.Integer(string='> 1 s', readonly=True)
+
+    _sql_constraints = [
+        ('method_day_uniq', 'unique(method, day)', 'There can only be one statistics row per method and day.'),
+    ]
+
+    @api.depends('calls', 'total_ms', 'sql_count')
+    def _compute_averages(self):
+        for stat in self:
+            stat.avg_ms = stat.total_ms / stat.calls if stat.calls else 0.0
+            stat.avg_sql_count = stat.sql_count / stat.calls if stat.calls else 0.0
+
+    @api.model
+    def action_flush(self):
+        """Write the statistics accumulated by this worker right away."""
+        flush_stats(self.env.registry, self.env.cr)
+        return True
+
+
+class CustomCalendarPerfSlow(models.Model):
+    _name = 'custom.calendar.perf.slow'
+    _description = 'Custom Calendar Slow Call'
+    _log_access = False
+    _rec_name = 'method'
+    _order = 'called_at desc, id desc'
+
+    method = fields.Char(string='Method', required=True, readonly=True)
+    called_at = fields.Datetime(string='Called At', readonly=True)
+    duration_ms = fields.Float(string='Duration (ms)', readonly=True)
+    sql_count = fields.Integer(string='SQL Queries', readonly=True)
+    res_model = fields.Char(string='Model', readonly=True)
+    res_ids = fields.Char(string='Record IDs', readonly=True)
+    record_count = fields.Integer(string='Records', readonly=True)
+    product_id = fields.Many2one('product.product', string='Product', readonly=True, ondelete='set null')
+    date = fields.Date(string='Date', readonly=True)
+
+    @api.model
+    def _cron_vacuum(self, days=30):
+        """Drop the slow calls and daily statistics older than ``days``."""
+        self.env.cr.execute("DELETE FROM custom_calendar_perf_slow WHERE called_at < (now() at time zone 'UTC') - %s * interval '1 day'", (days,))
+        self.env.cr.execute("DELETE FROM custom_calendar_perf_stat WHERE day < (now() at time zone 'UTC')::date - %s", (days,))
@@ -0,0 +1,64 @@
+from odoo import models, fields, api
+import logging
+
+from ..tools.calendar_log import log_batch
+
+_logger = logging.getLogger(__name__)
+
+
+class CustomCalendarQueue(models.Model):
+    _name = 'custom.calendar.queue'
+    _description = 'Custom Calendar Update Queue'
+    _log_access = False
+
+    product_id = fields.Many2one('product.product', string='Product', required=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade')
+    warehouse_id = fields.Many2one('stock.warehouse', string='Warehouse', ondelete='cascade')
+    date = fields.Date(string='Date', required=True)
+
+    def init(self):
+        # a calendar cell can only be queued once
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS custom_calendar_queue_cell_uniq
+            ON custom_calendar_queue (product_id, company_id, (COALESCE(warehouse_id, 0)), date)
+        """)
+
+    @api.model
+    def _enqueue(self, keys):
+        """Persist dirty calendar cells, ignoring the ones already queued."""
+        if not keys:
+            return
+        self.flush()
+        query = """
+            INSERT INTO custom_calendar_queue (product_id, company_id, warehouse_id, date)
+            VALUES {}
+            ON CONFLICT (product_id, company_id, (COALESCE(warehouse_id, 0)), date) DO NOTHING
+        """.format(', '.join(['(%s, %s, %s, %s)'] * len(keys)))
+        self.env.cr.execute(query, [value for key in keys for value in key])
+        _logger.debug('Queued %d calendar cells for recomputation', len(keys))
+
+    @api.model
+    def _cron_drain(self, batch_size=5000):
+        """Recompute the queued cells in batches, committing after each one."""
+        Report = self.env['custom.calendar.report']
+        while True:
+            # SKIP LOCKED lets several cron workers drain the queue side by side
+            self.env.cr.execute("""
+                DELETE FROM custom_calendar_queue
+                WHERE id IN (
+                    SELECT id FROM custom_calendar_queue
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING product_id, company_id, warehouse_id, date
+            """, (batch_size,))
+            keys = set(self.env.cr.fetchall())
+            if not keys:
+                break
+            with log_batch('calendar.drain_queue', cells=len(keys)) as summary:
+                summary['rows'] = len(Report._recompute_cells(keys))
+                Report.flush()
+            self.env.cr.commit()
+            if len(keys) < batch_size:
+                break
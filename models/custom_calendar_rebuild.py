@@ -0,0 +1,340 @@
+import odoo
+from odoo import models, fields, api, sql_db, SUPERUSER_ID, _
+from odoo.exceptions import ValidationError
+from odoo.modules.registry import Registry
+from odoo.service import server
+from odoo.tools.safe_eval import safe_eval
+from datetime import datetime, timedelta
+import logging
+import multiprocessing
+import time
+
+from ..tools.calendar_perf import discard_stats, flush_stats
+
+_logger = logging.getLogger(__name__)
+
+# Set-based equivalents of the _custom_calendar_ledger_entries() hooks, restricted to a product chunk and a window
+_LEDGER_PICKING_QUERY = """
+    INSERT INTO custom_calendar_ledger (res_model, res_id, product_id, company_id, warehouse_id, date, metric, quantity, ref_model, ref_id)
+    SELECT 'stock.picking', m.picking_id, m.product_id, m.company_id, m.warehouse_id, m.date, %(metric)s,
+           sum(l.{qty_column}), %(ref_model)s, min(l.order_id)
+    FROM (
+        SELECT DISTINCT sm.picking_id, sm.product_id, sp.company_id, spt.warehouse_id, sp.scheduled_date::date AS date,
+                        sm.{line_column} AS line_id
+        FROM stock_move sm
+        JOIN stock_picking sp ON sp.id = sm.picking_id
+        JOIN stock_picking_type spt ON spt.id = sp.picking_type_id
+        WHERE sm.product_id IN %(product_ids)s
+          AND sp.scheduled_date >= %(start)s AND sp.scheduled_date < %(end)s
+          AND sp.state != 'cancel'
+          AND spt.code IN ('incoming', 'outgoing')
+          AND sm.{line_column} IS NOT NULL
+    ) m
+    JOIN {line_table} l ON l.id = m.line_id
+    GROUP BY m.picking_id, m.product_id, m.company_id, m.warehouse_id, m.date
+    ON CONFLICT (res_model, res_id, product_id, date, metric) DO UPDATE SET
+        company_id = EXCLUDED.company_id, warehouse_id = EXCLUDED.warehouse_id,
+        quantity = EXCLUDED.quantity, ref_model = EXCLUDED.ref_model, ref_id = EXCLUDED.ref_id
+"""
+
+_LEDGER_PRODUCTION_QUERY = """
+    INSERT INTO custom_calendar_ledger (res_model, res_id, product_id, company_id, warehouse_id, date, metric, quantity, ref_model, ref_id)
+    SELECT 'mrp.production', mp.id, mp.product_id, mp.company_id, spt.warehouse_id, mp.date_planned_start::date,
+           'being_manufactured', mp.product_qty, 'mrp.production', mp.id
+    FROM mrp_production mp
+    LEFT JOIN stock_picking_type spt ON spt.id = mp.picking_type_id
+    WHERE mp.product_id IN %(product_ids)s
+      AND mp.date_planned_start >= %(start)s AND mp.date_planned_start < %(end)s
+    ON CONFLICT (res_model, res_id, product_id, date, metric) DO UPDATE SET
+        company_id = EXCLUDED.company_id, warehouse_id = EXCLUDED.warehouse_id,
+        quantity = EXCLUDED.quantity, ref_model = EXCLUDED.ref_model, ref_id = EXCLUDED.ref_id
+"""
+
+
+def _can_fork():
+    """Whether this process may fork rebuild workers.
+
+    Only a process running nothing else may: the command line, or a cron
+    worker of the prefork server. A threaded or evented server shares its
+    process with the HTTP threads, whose locks and cursors a fork would copy.
+    """
+    return not odoo.evented and (server.server is None or isinstance(server.server, server.PreforkServer))
+
+
+def _init_shard_worker(dbname):
+    # forked workers must open their own connections instead of sharing the parent's pooled sockets
+    sql_db._Pool = None
+    Registry(dbname)._db = sql_db.db_connect(dbname)
+    discard_stats()
+
+
+def _rebuild_shard(args):
+    """Rebuild one product shard of a job in its own cursor and transaction.
+
+    Runs in a pool process. Returns ``(shard index, rows written, error)``.
+    """
+    dbname, job_id, index, product_ids = args
+    try:
+        registry = Registry(dbname)
+        with api.Environment.manage(), registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {'calendar_skip_components': True})
+            rows = env['custom.calendar.rebuild'].browse(job_id)._rebuild_chunk(product_ids)
+        # statistics rows are shared by every shard: write them once the shard is committed, in a cursor of their own
+        flush_stats(registry)
+        return index, rows, None
+    except Exception as e:
+        _logger.exception('Calendar rebuild %s: shard of products %s to %s failed', job_id, product_ids[0], product_ids[-1])
+        return index, 0, str(e)
+
+
+class CustomCalendarRebuild(models.Model):
+    _name = 'custom.calendar.rebuild'
+    _description = 'Custom Calendar Rebuild'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', required=True, default=lambda self: _('Calendar Rebuild'))
+    date_from = fields.Date(string='From', required=True)
+    date_to = fields.Date(string='To', required=True)
+    product_domain = fields.Char(string='Product Domain', default='[]', required=True)
+    chunk_size = fields.Integer(string='Products per Chunk', default=200, required=True)
+    workers = fields.Integer(string='Worker Processes', default=1, required=True,
+                             help='Chunks are rebuilt in parallel by this many processes, each in its own transaction.')
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='draft', required=True, readonly=True)
+    last_product_id = fields.Integer(string='Last Processed Product', readonly=True,
+                                     help='Checkpoint: products up to this ID are rebuilt, an interrupted run resumes after it.')
+    product_count = fields.Integer(string='Products', readonly=True)
+    products_done = fields.Integer(string='Products Done', readonly=True)
+    rows_written = fields.Integer(string='Rows Written', readonly=True)
+    duration = fields.Float(string='Duration (s)', readonly=True)
+    rows_per_second = fields.Float(string='Rows per Second', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+
+    @api.constrains('date_from', 'date_to', 'chunk_size', 'workers')
+    def _check_window(self):
+        horizon_from, horizon_to = self.env['custom.calendar.report']._live_horizon()
+        for job in self:
+            if job.date_from > job.date_to:
+                raise ValidationError(_('The start of the rebuild window must be before its end.'))
+            # days out of the live horizon are only kept in the monthly archive
+            if (horizon_from and job.date_to < horizon_from) or (horizon_to and job.date_from > horizon_to):
+                raise ValidationError(_('The rebuild window must overlap the live horizon, from %(date_from)s to %(date_to)s.') % {
+                    'date_from': fields.Date.to_string(horizon_from) if horizon_from else '...',
+                    'date_to': fields.Date.to_string(horizon_to) if horizon_to else '...',
+                })
+            if job.chunk_size <= 0:
+                raise ValidationError(_('The chunk size must be positive.'))
+            if job.workers <= 0:
+                raise ValidationError(_('The number of worker processes must be positive.'))
+
+    def action_run(self):
+        # rebuilds commit chunk by chunk and may fork: they are run by the resume cron, not in the request
+        for job in self:
+            job._start()
+        self.env.ref('%s.ir_cron_custom_calendar_resume_rebuild' % self._module)._trigger()
+        return True
+
+    def action_reset(self):
+        self.write({
+            'state': 'draft',
+            'last_product_id': 0,
+            'products_done': 0,
+            'rows_written': 0,
+            'duration': 0.0,
+            'rows_per_second': 0.0,
+            'error': False,
+        })
+        return True
+
+    @api.model
+    def _cron_resume(self):
+        """Resume the rebuilds interrupted by a worker restart."""
+        for job in self.search([('state', '=', 'running')]):
+            job._run()
+
+    def _run(self, commit=True):
+        """Rebuild the window product chunk by product chunk, checkpointing after each chunk.
+
+        With ``commit`` the transaction is committed after every chunk, so an
+        interrupted run resumes from ``last_product_id``. A session-level
+        advisory lock keeps two workers from running the same job.
+        """
+        self.ensure_one()
+        cr = self.env.cr
+        cr.execute('SELECT pg_try_advisory_lock(%s, %s)', (self._table_lock_key(), self.id))
+        if not cr.fetchone()[0]:
+            _logger.info('Calendar rebuild %s is already running in another worker', self.id)
+            return
+        try:
+            product_domain = safe_eval(self.product_domain or '[]')
+            if self.state != 'running':
+                self._start()
+            product_ids = self.env['product.product'].with_context(active_test=False).search(
+                product_domain + [('id', '>', self.last_product_id)], order='id').ids
+            if commit:
+                cr.commit()
+
+            chunks = [product_ids[index:index + self.chunk_size] for index in range(0, len(product_ids), self.chunk_size)]
+            parallel = commit and self.workers > 1 and len(chunks) > 1
+            if parallel and not _can_fork():
+                _logger.warning('Calendar rebuild %s: this server cannot fork workers, running its chunks sequentially', self.id)
+                parallel = False
+            if parallel:
+                errors = self._run_parallel(chunks)
+            else:
+                errors = self._run_sequential(chunks, commit)
+
+            if errors:
+                self.write({'state': 'failed', 'error': '\n'.join(errors)})
+            else:
+                self.state = 'done'
+            if commit:
+                cr.commit()
+        except Exception as e:
+            if not commit:
+                raise
+            cr.rollback()
+            _logger.exception('Calendar rebuild %s failed', self.id)
+            self.write({'state': 'failed', 'error': str(e)})
+            cr.commit()
+        finally:
+            cr.execute('SELECT pg_advisory_unlock(%s, %s)', (self._table_lock_key(), self.id))
+
+    def _start(self):
+        self.ensure_one()
+        self.write({
+            'state': 'running',
+            'product_count': self._count_products(),
+            'products_done': self._count_products(self.last_product_id),
+        })
+
+    def _count_products(self, last_product_id=None):
+        """Count the products of the job, only the ones up to ``last_product_id`` when given."""
+        domain = safe_eval(self.product_domain or '[]')
+        if last_product_id is not None:
+            domain += [('id', '<=', last_product_id)]
+        return self.env['product.product'].with_context(active_test=False).search_count(domain)
+
+    def _run_sequential(self, chunks, commit):
+        for chunk in chunks:
+            start = time.time()
+            rows = self._rebuild_chunk(chunk)
+            self._update_progress(chunk[-1], rows, time.time() - start)
+            if commit:
+                self.env.cr.commit()
+            self.env.clear()
+        return []
+
+    def _run_parallel(self, chunks):
+        """Rebuild the chunks in a pool of ``workers`` processes and return the errors of the failed ones.
+
+        Chunks are disjoint product sets, so the workers write disjoint
+        ``(product, date)`` cells; their component cells, which may belong to
+        other chunks, are left to a final sequential pass. The checkpoint only
+        moves past chunks once every chunk before them is done.
+        """
+        cr = self.env.cr
+        done, errors, checkpoint = set(), [], 0
+        start = time.time()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(min(self.workers, len(chunks)), initializer=_init_shard_worker, initargs=(cr.dbname,)) as pool:
+            shards = [(cr.dbname, self.id, index, chunk) for index, chunk in enumerate(chunks)]
+            for index, rows, error in pool.imap_unordered(_rebuild_shard, shards):
+                chunk = chunks[index]
+                if error:
+                    errors.append(_('Products %s to %s: %s') % (chunk[0], chunk[-1], error))
+                    continue
+                done.add(index)
+                while checkpoint in done:
+                    checkpoint += 1
+                last_product_id = chunks[checkpoint - 1][-1] if checkpoint else self.last_product_id
+                self._update_progress(last_product_id, rows, time.time() - start)
+                start = time.time()
+                cr.commit()
+
+        if not errors:
+            start = time.time()
+            product_ids = [product_id for chunk in chunks for product_id in chunk]
+            self._update_progress(self.last_product_id, self._rebuild_component_cells(product_ids), time.time() - start)
+        return errors
+
+    def _update_progress(self, last_product_id, rows, duration):
+        # counted from the checkpoint, so chunks redone by a resumed run are not counted twice
+        self.write({
+            'last_product_id': last_product_id,
+            'products_done': self._count_products(last_product_id),
+            'rows_written': self.rows_written + rows,
+            'duration': self.duration + duration,
+        })
+        self.rows_per_second = self.rows_written / self.duration if self.duration else 0.0
+        _logger.info('Calendar rebuild %s: %d/%d products, %d rows, %.1f rows/s',
+                     self.id, self.products_done, self.product_count, self.rows_written, self.rows_per_second)
+
+    def _rebuild_component_cells(self, product_ids):
+        """Recompute the component cells fed by the manufacturing orders of ``product_ids`` over the window.
+
+        Cells still carrying a component demand are included, so demand from
+        orders moved out of the window is cleared too. Returns the number of
+        cells written.
+        """
+        Report = self.env['custom.calendar.report']
+        Report.flush()
+        self.env.cr.execute("""
+            SELECT product_id, company_id, warehouse_id, date FROM custom_calendar_ledger
+            WHERE product_id IN %(product_ids)s AND metric = 'being_manufactured'
+              AND date >= %(date_from)s AND date <= %(date_to)s
+        """, {'product_ids': tuple(product_ids), 'date_from': self.date_from, 'date_to': self.date_to})
+        manufactured_keys = set(self.env.cr.fetchall())
+        keys = Report._component_keys(manufactured_keys) if manufactured_keys else set()
+        self.env.cr.execute("""
+            SELECT product_id, company_id, warehouse_id, date FROM custom_calendar_report
+            WHERE product_id IN %(product_ids)s AND component_demand != 0
+              AND date >= %(date_from)s AND date <= %(date_to)s
+        """, {'product_ids': tuple(product_ids), 'date_from': self.date_from, 'date_to': self.date_to})
+        keys.update(self.env.cr.fetchall())
+        cells = Report._recompute_cells(keys)
+        Report.flush()
+        return len(cells)
+
+    def _table_lock_key(self):
+        self.env.cr.execute('SELECT %s::regclass::oid::integer', (self._table,))
+        return self.env.cr.fetchone()[0]
+
+    def _rebuild_chunk(self, product_ids):
+        """Rebuild the ledger and the cells of ``product_ids`` over the window. Returns the number of rows written."""
+        Ledger = self.env['custom.calendar.ledger']
+        Ledger.flush()
+        # the ledger before the archive cutoff only holds opening balances
+        cutoff = self.env['custom.calendar.report']._archive_cutoff()
+        date_from = max(self.date_from, cutoff) if cutoff else self.date_from
+        params = {
+            'product_ids': tuple(product_ids),
+            'date_from': date_from,
+            'date_to': self.date_to,
+            'start': datetime.combine(date_from, datetime.min.time()),
+            'end': datetime.combine(self.date_to, datetime.min.time()) + timedelta(days=1),
+        }
+        cr = self.env.cr
+        cr.execute("""
+            DELETE FROM custom_calendar_ledger
+            WHERE product_id IN %(product_ids)s AND date >= %(date_from)s AND date <= %(date_to)s
+        """, params)
+        rows = 0
+        for metric, ref_model, line_table, line_column, qty_column in [
+            ('sale_order_quantity', 'sale.order', 'sale_order_line', 'sale_line_id', 'product_uom_qty'),
+            ('purchase_order_quantity', 'purchase.order', 'purchase_order_line', 'purchase_line_id', 'product_qty'),
+        ]:
+            cr.execute(_LEDGER_PICKING_QUERY.format(line_table=line_table, line_column=line_column, qty_column=qty_column),
+                       dict(params, metric=metric, ref_model=ref_model))
+            rows += cr.rowcount
+        cr.execute(_LEDGER_PRODUCTION_QUERY, params)
+        rows += cr.rowcount
+        Ledger.invalidate_cache()
+
+        cells = Ledger._rebuild_cells(product_ids, date_from, self.date_to)
+        self.env['custom.calendar.report'].flush()
+        return rows + len(cells)
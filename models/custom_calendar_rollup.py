@@ -0,0 +1,143 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+ROLLUP_MODELS = ['custom.calendar.report.week', 'custom.calendar.report.month']
+
+
+class CustomCalendarRollup(models.AbstractModel):
+    _name = 'custom.calendar.rollup'
+    _description = 'Custom Calendar Rollup'
+    _log_access = False
+    _rec_name = 'product_id'
+    _order = 'date_start, product_id, company_id, warehouse_id'
+
+    # PostgreSQL date_trunc() unit of the concrete rollup
+    _period = None
+    # Whether the periods also sum the days compacted into the monthly archive
+    _merge_archive = False
+
+    product_id = fields.Many2one('product.product', string='Product', required=True, ondelete='cascade', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade', readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string='Warehouse', ondelete='cascade', readonly=True)
+    date_start = fields.Date(string='Start Date', required=True, readonly=True)
+    date_stop = fields.Date(string='End Date', required=True, readonly=True)
+    sale_order_quantity = fields.Float(string='Sale Order Quantity', readonly=True)
+    purchase_order_quantity = fields.Float(string='Purchase Order Quantity', readonly=True)
+    being_manufactured = fields.Float(string='Being Manufactured', readonly=True)
+    reserved_quantity = fields.Float(string='Reserved Quantity', readonly=True)
+    stock_on_hand = fields.Float(string='Stock on Hand', readonly=True, help='Stock on hand of the last day of the period.')
+    forecast_quantity = fields.Float(string='Forecast Quantity', readonly=True, help='Forecast quantity of the last day of the period.')
+    today_current_stock = fields.Float(string='Current Stock\'s Left', readonly=True, help='Stock left at the end of the last day of the period.')
+    day_count = fields.Integer(string='Days', readonly=True)
+
+    def init(self):
+        if self._abstract:
+            return
+        # one rollup row per product, site and period
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS {table}_cell_uniq
+            ON {table} (product_id, company_id, (COALESCE(warehouse_id, 0)), date_start)
+        """.format(table=self._table))
+
+    @api.model
+    def _period_start(self, date):
+        if self._period == 'week':
+            return date - timedelta(days=date.weekday())
+        return date.replace(day=1)
+
+    @api.model
+    def _refresh(self, keys=None):
+        """Recompute the rollup rows covering the calendar cells in ``keys`` from the daily table.
+
+        Every rollup row from the period of the archive cutoff on is rebuilt
+        when ``keys`` is None; older rows only cover archived days and are
+        kept. Rollups merging the archive also add the archived days of their
+        periods: quantities and day counts are summed, stock figures are the
+        last daily cell's, else the archive's.
+        """
+        self.env['custom.calendar.report'].flush()
+        self.env['custom.calendar.report.archive'].flush()
+        self.flush()
+        if keys is not None:
+            periods = tuple({
+                (product_id, company_id, warehouse_id or 0, self._period_start(date))
+                for product_id, company_id, warehouse_id, date in keys
+            })
+            if not periods:
+                return
+            self.env.cr.execute("""
+                DELETE FROM {} WHERE (product_id, company_id, COALESCE(warehouse_id, 0), date_start) IN %s
+            """.format(self._table), [periods])
+            product_ids = tuple({period[0] for period in periods})
+            daily_where = """r.product_id IN %s
+                AND (r.product_id, r.company_id, COALESCE(r.warehouse_id, 0), date_trunc(%s, r.date)::date) IN %s"""
+            daily_params = [product_ids, self._period, periods]
+            archive_where = """a.product_id IN %s
+                AND (a.product_id, a.company_id, COALESCE(a.warehouse_id, 0), a.date_start) IN %s"""
+            archive_params = [product_ids, periods]
+        else:
+            cutoff = self.env['custom.calendar.report']._archive_cutoff()
+            if cutoff:
+                period_start = self._period_start(cutoff)
+                self.env.cr.execute('DELETE FROM {} WHERE date_start >= %s'.format(self._table), [period_start])
+                daily_where, daily_params = 'r.date >= %s', [period_start]
+                archive_where, archive_params = 'a.date_start >= %s', [period_start]
+            else:
+                self.env.cr.execute('DELETE FROM {}'.format(self._table))
+                daily_where, daily_params, archive_where, archive_params = 'TRUE', [], 'TRUE', []
+
+        archive_query, params = '', ['1 ' + self._period, self._period] + daily_params
+        if self._merge_archive:
+            archive_query = """
+                UNION ALL
+                SELECT a.product_id, a.company_id, a.warehouse_id, a.date_start, NULL,
+                       a.sale_order_quantity, a.purchase_order_quantity, a.being_manufactured, a.reserved_quantity,
+                       a.stock_on_hand, a.forecast_quantity, a.today_current_stock, a.day_count
+                FROM custom_calendar_report_archive a
+                WHERE {where}
+            """.format(where=archive_where)
+            params += archive_params
+        self.env.cr.execute("""
+            INSERT INTO {table} (product_id, company_id, warehouse_id, date_start, date_stop, sale_order_quantity,
+                                 purchase_order_quantity, being_manufactured, reserved_quantity, stock_on_hand,
+                                 forecast_quantity, today_current_stock, day_count)
+            SELECT c.product_id, c.company_id, c.warehouse_id, c.date_start,
+                   (c.date_start + %s::interval - interval '1 day')::date,
+                   sum(c.sale_order_quantity),
+                   sum(c.purchase_order_quantity),
+                   sum(c.being_manufactured),
+                   sum(c.reserved_quantity),
+                   (array_agg(c.stock_on_hand ORDER BY c.date DESC NULLS LAST))[1],
+                   (array_agg(c.forecast_quantity ORDER BY c.date DESC NULLS LAST))[1],
+                   (array_agg(c.today_current_stock ORDER BY c.date DESC NULLS LAST))[1],
+                   sum(c.day_count)
+            FROM (
+                SELECT r.product_id, r.company_id, r.warehouse_id, date_trunc(%s, r.date)::date AS date_start, r.date,
+                       r.sale_order_quantity, r.purchase_order_quantity, r.being_manufactured, r.reserved_quantity,
+                       r.stock_on_hand, r.forecast_quantity, r.today_current_stock, 1 AS day_count
+                FROM custom_calendar_report r
+                WHERE {where}
+                {archive_query}
+            ) c
+            GROUP BY c.product_id, c.company_id, c.warehouse_id, c.date_start
+        """.format(table=self._table, where=daily_where, archive_query=archive_query), params)
+        self.invalidate_cache()
+        _logger.debug('Refreshed %d %s rollup rows', self.env.cr.rowcount, self._period)
+
+
+class CustomCalendarReportWeek(models.Model):
+    _name = 'custom.calendar.report.week'
+    _inherit = 'custom.calendar.rollup'
+    _description = 'Custom Calendar Weekly Report'
+    _period = 'week'
+
+
+class CustomCalendarReportMonth(models.Model):
+    _name = 'custom.calendar.report.month'
+    _inherit = 'custom.calendar.rollup'
+    _description = 'Custom Calendar Monthly Report'
+    _period = 'month'
+    _merge_archive = True
@@ -0,0 +1,82 @@
+from odoo import models, fields, api
+from dateutil.relativedelta import relativedelta
+import logging
+
+from ..tools.calendar_log import log_batch
+
+_logger = logging.getLogger(__name__)
+
+
+class CustomCalendarReportArchive(models.Model):
+    _name = 'custom.calendar.report.archive'
+    _inherit = 'custom.calendar.rollup'
+    _description = 'Custom Calendar Report Archive'
+    _period = 'month'
+
+    component_demand = fields.Float(string='Component Demand', readonly=True)
+
+    @api.model
+    def _compact(self, cutoff):
+        """Fold the daily cells dated before ``cutoff`` into monthly archive rows and delete them.
+
+        Months are compacted oldest first and committed one by one. A month
+        cut by the horizon is merged into its archive row again when its
+        remaining days age out: quantities and day counts are added, the
+        last-day stock figures are replaced by the later days'.
+        """
+        Report = self.env['custom.calendar.report']
+        Report.flush()
+        self.flush()
+        cr = self.env.cr
+        cr.execute("""
+            SELECT DISTINCT date_trunc('month', date)::date FROM custom_calendar_report
+            WHERE date < %s ORDER BY 1
+        """, (cutoff,))
+        for month_start, in cr.fetchall():
+            month_stop = min(month_start + relativedelta(months=1), cutoff)
+            with log_batch('calendar.compact', month=month_start) as summary:
+                cr.execute("""
+                    INSERT INTO custom_calendar_report_archive AS a
+                        (product_id, company_id, warehouse_id, date_start, date_stop, sale_order_quantity,
+                         purchase_order_quantity, being_manufactured, reserved_quantity, component_demand,
+                         stock_on_hand, forecast_quantity, today_current_stock, day_count)
+                    SELECT r.product_id, r.company_id, r.warehouse_id, %(month)s, %(month_end)s,
+                           sum(r.sale_order_quantity),
+                           sum(r.purchase_order_quantity),
+                           sum(r.being_manufactured),
+                           sum(r.reserved_quantity),
+                           sum(r.component_demand),
+                           (array_agg(r.stock_on_hand ORDER BY r.date DESC))[1],
+                           (array_agg(r.forecast_quantity ORDER BY r.date DESC))[1],
+                           (array_agg(r.today_current_stock ORDER BY r.date DESC))[1],
+                           count(*)
+                    FROM custom_calendar_report r
+                    WHERE r.date >= %(month)s AND r.date < %(stop)s
+                    GROUP BY r.product_id, r.company_id, r.warehouse_id
+                    ON CONFLICT (product_id, company_id, (COALESCE(warehouse_id, 0)), date_start) DO UPDATE SET
+                        sale_order_quantity = a.sale_order_quantity + EXCLUDED.sale_order_quantity,
+                        purchase_order_quantity = a.purchase_order_quantity + EXCLUDED.purchase_order_quantity,
+                        being_manufactured = a.being_manufactured + EXCLUDED.being_manufactured,
+                        reserved_quantity = a.reserved_quantity + EXCLUDED.reserved_quantity,
+                        component_demand = a.component_demand + EXCLUDED.component_demand,
+                        stock_on_hand = EXCLUDED.stock_on_hand,
+                        forecast_quantity = EXCLUDED.forecast_quantity,
+                        today_current_stock = EXCLUDED.today_current_stock,
+                        day_count = a.day_count + EXCLUDED.day_count
+                """, {
+                    'month': month_start,
+                    'month_end': month_start + relativedelta(months=1, days=-1),
+                    'stop': month_stop,
+                })
+                summary['cells'] = cr.rowcount
+                cr.execute("""
+                    DELETE FROM custom_calendar_report
+                    WHERE date >= %s AND date < %s
+                    RETURNING date
+                """, (month_start, month_stop))
+                dates = {row[0] for row in cr.fetchall()}
+                summary['rows'] = cr.rowcount
+                self.env['custom.calendar.version']._bump(dates)
+            Report.invalidate_cache()
+            self.invalidate_cache()
+            cr.commit()
@@ -0,0 +1,116 @@
+from odoo import models, fields, api, _
+import logging
+
+from ..tools.calendar_log import log_batch
+
+_logger = logging.getLogger(__name__)
+
+
+class CustomCalendarShortage(models.Model):
+    _name = 'custom.calendar.shortage'
+    _description = 'Custom Calendar Shortage'
+    _log_access = False
+    _rec_name = 'product_id'
+    _order = 'breach_date, shortfall desc'
+
+    product_id = fields.Many2one('product.product', string='Product', required=True, ondelete='cascade', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade', readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string='Warehouse', ondelete='cascade', readonly=True)
+    breach_date = fields.Date(string='Breach Date', required=True, readonly=True, index=True,
+                              help='First day from today on whose projected stock left is negative.')
+    shortfall = fields.Float(string='Shortfall', readonly=True, help='Quantity missing on the lowest projected day.')
+    lowest_date = fields.Date(string='Lowest Day', readonly=True)
+    breach_days = fields.Integer(string='Days Short', readonly=True, help='Calendar days with a negative projected stock left.')
+    alert_pending = fields.Boolean(string='Alert Pending', readonly=True)
+    alerted_breach_date = fields.Date(string='Alerted Breach Date', readonly=True)
+    alerted_shortfall = fields.Float(string='Alerted Shortfall', readonly=True)
+
+    def init(self):
+        # one shortage per product and site
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS custom_calendar_shortage_series_uniq
+            ON custom_calendar_shortage (product_id, company_id, (COALESCE(warehouse_id, 0)))
+        """)
+
+    @api.model
+    def _refresh(self, product_ids):
+        """Recompute the shortages of ``product_ids`` from their projected calendar cells.
+
+        Only the cells of these products from today on are scanned. A
+        shortage is raised again when its breach date moves earlier or its
+        shortfall deepens since the last alert; series back above zero lose
+        their shortage.
+        """
+        if not product_ids:
+            return
+        self.flush()
+        cr = self.env.cr
+        params = {'product_ids': tuple(product_ids), 'today': fields.Date.context_today(self)}
+        cr.execute("""
+            WITH breach AS (
+                SELECT product_id, company_id, warehouse_id,
+                       min(date) AS breach_date,
+                       -min(today_current_stock) AS shortfall,
+                       (array_agg(date ORDER BY today_current_stock, date))[1] AS lowest_date,
+                       count(*) AS breach_days
+                FROM custom_calendar_report
+                WHERE product_id IN %(product_ids)s AND date >= %(today)s AND today_current_stock < 0
+                GROUP BY product_id, company_id, warehouse_id
+            ), cleared AS (
+                DELETE FROM custom_calendar_shortage s
+                WHERE s.product_id IN %(product_ids)s
+                  AND NOT EXISTS (
+                      SELECT 1 FROM breach b
+                      WHERE b.product_id = s.product_id AND b.company_id = s.company_id
+                        AND COALESCE(b.warehouse_id, 0) = COALESCE(s.warehouse_id, 0)
+                  )
+            )
+            INSERT INTO custom_calendar_shortage AS s
+                (product_id, company_id, warehouse_id, breach_date, shortfall, lowest_date, breach_days, alert_pending)
+            SELECT product_id, company_id, warehouse_id, breach_date, shortfall, lowest_date, breach_days, TRUE
+            FROM breach
+            ON CONFLICT (product_id, company_id, (COALESCE(warehouse_id, 0))) DO UPDATE SET
+                breach_date = EXCLUDED.breach_date,
+                shortfall = EXCLUDED.shortfall,
+                lowest_date = EXCLUDED.lowest_date,
+                breach_days = EXCLUDED.breach_days,
+                alert_pending = s.alert_pending
+                    OR s.alerted_breach_date IS NULL
+                    OR EXCLUDED.breach_date < s.alerted_breach_date
+                    OR EXCLUDED.shortfall > s.alerted_shortfall
+        """, params)
+        self.invalidate_cache()
+        _logger.debug('Refreshed the shortages of %d products: %d at risk', len(product_ids), cr.rowcount)
+
+    @api.model
+    def _cron_post_alerts(self, batch_size=200):
+        """Post a note on the products of the new or worsened shortages, once per change."""
+        while True:
+            shortages = self.sudo().search([('alert_pending', '=', True)], limit=batch_size)
+            if not shortages:
+                break
+            with log_batch('calendar.shortage_alerts', shortages=len(shortages)):
+                for shortage in shortages:
+                    shortage.product_id.product_tmpl_id.sudo().message_post(
+                        body=shortage._alert_message(), subtype_xmlid='mail.mt_note')
+                for shortage in shortages:
+                    shortage.write({
+                        'alert_pending': False,
+                        'alerted_breach_date': shortage.breach_date,
+                        'alerted_shortfall': shortage.shortfall,
+                    })
+                self.flush()
+            self.env.cr.commit()
+            if len(shortages) < batch_size:
+                break
+
+    def _alert_message(self):
+        self.ensure_one()
+        site = self.warehouse_id.name or self.company_id.name
+        return _('%(product)s is projected short at %(site)s from %(breach_date)s, by up to %(shortfall)s on %(lowest_date)s.') % {
+            'product': self.product_id.display_name,
+            'site': site,
+            'breach_date': fields.Date.to_string(self.breach_date),
+            'shortfall': self.shortfall,
+            'lowest_date': fields.Date.to_string(self.lowest_date),
+        }
@@ -0,0 +1,68 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CustomCalendarVersion(models.Model):
+    _name = 'custom.calendar.version'
+    _description = 'Custom Calendar Date Version'
+    _log_access = False
+    _rec_name = 'date'
+    _order = 'date, id'
+
+    date = fields.Date(string='Date', required=True, readonly=True, index=True)
+    version = fields.Integer(string='Changes', required=True, readonly=True)
+    changed_at = fields.Datetime(string='Changed At', required=True, readonly=True)
+
+    @api.model
+    def _bump(self, dates):
+        """Record a change of the calendar cells of each of ``dates``.
+
+        The log is insert-only: concurrent transactions bumping the same date
+        append rows of their own instead of updating a shared one, so they
+        never wait on or conflict with each other. The version of a date is
+        the number of changes it went through.
+        """
+        if not dates:
+            return
+        self.env.cr.execute("""
+            INSERT INTO custom_calendar_version (date, version, changed_at)
+            SELECT d, 1, clock_timestamp() at time zone 'UTC'
+            FROM unnest(%s::date[]) AS d
+        """, (sorted(dates),))
+        self.invalidate_cache()
+        _logger.debug('Bumped the calendar version of %d dates', len(dates))
+
+    @api.model
+    def _window_version(self, date_from, date_to):
+        """Return ``(version, last change)`` of the window between ``date_from`` and ``date_to`` (inclusive).
+
+        The version is the number of changes of the window's dates: it grows
+        with every committed bump, whichever transaction commits first.
+        """
+        self.env.cr.execute("""
+            SELECT coalesce(sum(version), 0), max(changed_at)
+            FROM custom_calendar_version
+            WHERE date >= %s AND date <= %s
+        """, (date_from, date_to))
+        return self.env.cr.fetchone()
+
+    @api.model
+    def _cron_compact(self):
+        """Merge the change rows of every date into one, keeping the window versions unchanged.
+
+        Rows appended by transactions still running are not visible here and
+        are merged by a later run.
+        """
+        self.env.cr.execute("""
+            WITH merged AS (
+                DELETE FROM custom_calendar_version
+                WHERE date IN (SELECT date FROM custom_calendar_version GROUP BY date HAVING count(*) > 1)
+                RETURNING date, version, changed_at
+            )
+            INSERT INTO custom_calendar_version (date, version, changed_at)
+            SELECT date, sum(version), max(changed_at) FROM merged GROUP BY date
+        """)
+        _logger.info('Compacted the calendar versions of %d dates', self.env.cr.rowcount)
+        self.invalidate_cache()
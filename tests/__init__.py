@@ -0,0 +1,4 @@
+from . import test_calendar_benchmark
+from . import test_calendar_controller
+from . import test_calendar_report
+from . import test_calendar_tools
@@ -0,0 +1,101 @@
+from datetime import datetime, time, timedelta
+import os
+import random
+
+# Dataset size, overridable through CALENDAR_BENCHMARK_<NAME> environment variables
+DEFAULT_PARAMS = {
+    'products': 200,
+    'boms': 50,
+    'bom_depth': 3,
+    'pickings': 500,
+    'productions': 200,
+    'horizon_days': 90,
+    'seed': 42,
+}
+
+
+def benchmark_params():
+    return {name: int(os.environ.get('CALENDAR_BENCHMARK_%s' % name.upper(), default)) for name, default in DEFAULT_PARAMS.items()}
+
+
+def generate_dataset(env, params):
+    """Create a synthetic manufacturing dataset and return its records.
+
+    Products are split in ``bom_depth + 1`` layers; the BoMs of a layer use
+    components of the next one, so explosions are ``bom_depth`` levels deep.
+    Half of the pickings come from confirmed sale orders and half from
+    confirmed purchase orders; pickings and manufacturing orders are spread
+    over ``horizon_days`` days starting today.
+    """
+    rng = random.Random(params['seed'])
+    today = datetime.combine(datetime.utcnow().date(), time(12))
+
+    def random_datetime():
+        return today + timedelta(days=rng.randrange(params['horizon_days']))
+
+    products = env['product.product'].create([{
+        'name': 'Benchmark Product %05d' % index,
+        'type': 'product',
+    } for index in range(params['products'])])
+
+    depth = max(params['bom_depth'], 1)
+    layers = [products[layer::depth + 1] for layer in range(depth + 1)]
+    bom_vals = []
+    for index in range(params['boms']):
+        layer = index % depth
+        if not layers[layer] or not layers[layer + 1]:
+            continue
+        product = layers[layer][(index // depth) % len(layers[layer])]
+        components = rng.sample(list(layers[layer + 1]), min(3, len(layers[layer + 1])))
+        bom_vals.append({
+            'product_tmpl_id': product.product_tmpl_id.id,
+            'product_qty': 1.0,
+            'bom_line_ids': [(0, 0, {'product_id': component.id, 'product_qty': rng.randint(1, 5)}) for component in components],
+        })
+    boms = env['mrp.bom'].create(bom_vals)
+
+    partner = env['res.partner'].create({'name': 'Benchmark Partner'})
+    sale_orders = env['sale.order'].create([{
+        'partner_id': partner.id,
+        'commitment_date': random_datetime(),
+        'order_line': [(0, 0, {
+            'product_id': product.id,
+            'product_uom_qty': rng.randint(1, 20),
+        }) for product in rng.sample(list(products), rng.randint(1, 3))],
+    } for __ in range(params['pickings'] // 2)])
+    purchase_orders = env['purchase.order'].create([{
+        'partner_id': partner.id,
+        'date_planned': random_datetime(),
+        'order_line': [(0, 0, {
+            'product_id': product.id,
+            'name': product.name,
+            'product_qty': rng.randint(1, 20),
+            'product_uom': product.uom_id.id,
+            'price_unit': 1.0,
+            'date_planned': random_datetime(),
+        }) for product in rng.sample(list(products), rng.randint(1, 3))],
+    } for __ in range(params['pickings'] - params['pickings'] // 2)])
+    sale_orders.action_confirm()
+    purchase_orders.button_confirm()
+
+    manufactured = boms.mapped('product_tmpl_id.product_variant_id')
+    production_vals = []
+    for __ in range(params['productions'] if manufactured else 0):
+        product = rng.choice(list(manufactured))
+        production_vals.append({
+            'product_id': product.id,
+            'product_uom_id': product.uom_id.id,
+            'product_qty': rng.randint(1, 10),
+            'date_planned_start': random_datetime(),
+        })
+
+    return {
+        'rng': rng,
+        'products': products,
+        'boms': boms,
+        'partner': partner,
+        'sale_orders': sale_orders,
+        'purchase_orders': purchase_orders,
+        'production_vals': production_vals,
+        'random_datetime': random_datetime,
+    }
@@ -0,0 +1,239 @@
+from collections import defaultdict
+from datetime import timedelta
+import json
+import logging
+import os
+import tempfile
+import time
+
+from odoo.tests import SavepointCase, tagged
+
+from .common import benchmark_params, generate_dataset
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('-standard', '-at_install', 'post_install', 'calendar_benchmark')
+class TestCalendarBenchmark(SavepointCase):
+    """Throughput and query count of the calendar hooks on a synthetic dataset.
+
+    Not part of the standard test suite, run it explicitly with
+    ``--test-tags calendar_benchmark``. Results are written as JSON to the
+    file named by the ``CALENDAR_BENCHMARK_OUTPUT`` environment variable.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.params = benchmark_params()
+        cls.results = []
+        start = time.perf_counter()
+        cls.dataset = generate_dataset(cls.env, cls.params)
+        cls.env['base'].flush()
+        cls.env.cr.precommit.run()
+        _logger.info('Generated calendar benchmark dataset %s in %.1fs', cls.params, time.perf_counter() - start)
+
+    @classmethod
+    def tearDownClass(cls):
+        output = os.environ.get('CALENDAR_BENCHMARK_OUTPUT') or os.path.join(tempfile.gettempdir(), 'custom_calendar_benchmark.json')
+        with open(output, 'w') as f:
+            json.dump({'params': cls.params, 'results': cls.results}, f, indent=2, default=str)
+        _logger.info('Wrote %d calendar benchmark results to %s', len(cls.results), output)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('custom_calendar.update_mode', 'commit')
+
+    def _measure(self, name, func, records, path='batched', commit_hooks=True):
+        """Run ``func`` then the end-of-transaction calendar flush, and record its duration and query count.
+
+        With ``commit_hooks=False`` the precommit hooks are not run, which
+        keeps the per-transaction caches they would clear.
+        """
+        cr = self.env.cr
+        self.env['base'].flush()
+        if commit_hooks:
+            cr.precommit.run()
+        sql_start = cr.sql_log_count
+        start = time.perf_counter()
+        func()
+        self.env['base'].flush()
+        if commit_hooks:
+            cr.precommit.run()
+        duration = time.perf_counter() - start
+        result = {
+            'name': name,
+            'path': path,
+            'records': records,
+            'seconds': round(duration, 4),
+            'queries': cr.sql_log_count - sql_start,
+            'records_per_second': round(records / duration, 1) if duration else None,
+        }
+        self.results.append(result)
+        _logger.info('Calendar benchmark %(name)s [%(path)s]: %(records)d records in %(seconds).3fs, %(queries)d queries', result)
+        return result
+
+    def _drain_queue(self):
+        # same as the queue cron, without its per-batch commits
+        self.env['custom.calendar.queue'].flush()
+        self.env.cr.execute('DELETE FROM custom_calendar_queue RETURNING product_id, company_id, warehouse_id, date')
+        self.env['custom.calendar.report']._recompute_cells(set(self.env.cr.fetchall()))
+
+    def _picking_vals(self, count):
+        rng = self.dataset['rng']
+        picking_type = self.env.ref('stock.picking_type_out')
+        return [{
+            'partner_id': self.dataset['partner'].id,
+            'picking_type_id': picking_type.id,
+            'location_id': picking_type.default_location_src_id.id,
+            'location_dest_id': self.env.ref('stock.stock_location_customers').id,
+            'scheduled_date': self.dataset['random_datetime'](),
+            'move_ids_without_package': [(0, 0, {
+                'name': product.name,
+                'product_id': product.id,
+                'product_uom': product.uom_id.id,
+                'product_uom_qty': rng.randint(1, 10),
+            }) for product in rng.sample(list(self.dataset['products']), 2)],
+        } for __ in range(count)]
+
+    def _ledger_rows(self):
+        self.env['custom.calendar.ledger'].flush()
+        self.env.cr.execute("""
+            SELECT res_model, res_id, product_id, company_id, warehouse_id, date, metric, round(quantity::numeric, 4), ref_model, ref_id
+            FROM custom_calendar_ledger
+            ORDER BY res_model, res_id, product_id, metric, date
+        """)
+        return self.env.cr.fetchall()
+
+    def test_ledger_consistency(self):
+        """The ledger holds the quantities of the generated orders, and syncing their documents again leaves it unchanged."""
+        Ledger = self.env['custom.calendar.ledger']
+        sale_orders, purchase_orders = self.dataset['sale_orders'], self.dataset['purchase_orders']
+        productions = self.env['mrp.production'].create(self.dataset['production_vals'])
+        self.env['base'].flush()
+        self.env.cr.precommit.run()
+
+        expected = defaultdict(float)
+        for line in sale_orders.mapped('order_line'):
+            expected['sale_order_quantity', line.product_id.id] += line.product_uom_qty
+        for line in purchase_orders.mapped('order_line'):
+            expected['purchase_order_quantity', line.product_id.id] += line.product_qty
+        for production in productions:
+            expected['being_manufactured', production.product_id.id] += production.product_qty
+
+        Ledger.flush()
+        self.env.cr.execute("""
+            SELECT metric, product_id, sum(quantity) FROM custom_calendar_ledger
+            WHERE (ref_model = 'sale.order' AND ref_id IN %s)
+               OR (ref_model = 'purchase.order' AND ref_id IN %s)
+               OR (ref_model = 'mrp.production' AND ref_id IN %s)
+            GROUP BY metric, product_id
+        """, (tuple(sale_orders.ids) or (0,), tuple(purchase_orders.ids) or (0,), tuple(productions.ids) or (0,)))
+        totals = {(metric, product_id): quantity for metric, product_id, quantity in self.env.cr.fetchall()}
+        self.assertEqual(set(totals), set(expected))
+        for key, quantity in expected.items():
+            self.assertAlmostEqual(totals[key], quantity, places=4, msg='ledger total of %s %s' % key)
+
+        rows = self._ledger_rows()
+        Ledger._sync_documents((sale_orders | purchase_orders).mapped('picking_ids'))
+        Ledger._sync_documents(productions)
+        self.assertEqual(self._ledger_rows(), rows)
+
+    def test_picking_create_write_confirm(self):
+        Picking = self.env['stock.picking']
+        vals_list = self._picking_vals(self.params['pickings'])
+        pickings = Picking.browse()
+
+        def create():
+            nonlocal pickings
+            pickings = Picking.create(vals_list)
+        self._measure('picking.create', create, len(vals_list))
+
+        single_vals = self._picking_vals(min(len(vals_list), 50))
+        self._measure('picking.create', lambda: [Picking.create(vals) for vals in single_vals], len(single_vals),
+                      path='per_record_create')
+
+        self._measure('picking.write', lambda: pickings.write({
+            'scheduled_date': self.dataset['random_datetime'](),
+        }), len(pickings))
+        self._measure('picking.confirm', pickings.action_confirm, len(pickings))
+
+        order_pickings = (self.dataset['sale_orders'] | self.dataset['purchase_orders']).mapped('picking_ids')
+        self._measure('picking.write', lambda: [
+            picking.write({'scheduled_date': picking.scheduled_date + timedelta(days=1)}) for picking in order_pickings
+        ], len(order_pickings), path='per_record_write')
+
+        def per_record_flush():
+            for picking in order_pickings:
+                picking.write({'scheduled_date': picking.scheduled_date + timedelta(days=1)})
+                self.env['base'].flush()
+                self.env.cr.precommit.run()
+        self._measure('picking.write', per_record_flush, len(order_pickings), path='per_record_flush')
+
+    def test_production_date_moves(self):
+        productions = self.env['mrp.production']
+
+        def create():
+            nonlocal productions
+            productions = productions.create(self.dataset['production_vals'])
+        self._measure('production.create', create, len(self.dataset['production_vals']))
+
+        self._measure('production.move_dates', lambda: [
+            production.write({'date_planned_start': production.date_planned_start + timedelta(days=1)})
+            for production in productions
+        ], len(productions))
+
+        self.env['ir.config_parameter'].sudo().set_param('custom_calendar.update_mode', 'cron')
+
+        def deferred():
+            for production in productions:
+                production.write({'date_planned_start': production.date_planned_start + timedelta(days=1)})
+            self.env['base'].flush()
+            self.env.cr.precommit.run()
+            self._drain_queue()
+        self._measure('production.move_dates', deferred, len(productions), path='queued')
+
+    def test_full_recompute(self):
+        Ledger = self.env['custom.calendar.ledger']
+        Report = self.env['custom.calendar.report']
+        products = self.dataset['products']
+        self._measure('calendar.rebuild_cells', Ledger._rebuild_cells, len(products))
+
+        reports = Report.search([])
+        self._measure('calendar.recompute_cells', lambda: Report._recompute_cells({
+            report._cell_key() for report in reports
+        }), len(reports))
+        self._measure('calendar.refresh_projection', lambda: Report._recompute_projection(set(products.ids)), len(products))
+
+        def stock_figures():
+            Report._invalidate_stock_figures(products.ids)
+            Report._get_stock_figures(products.ids)
+        self._measure('calendar.stock_figures', stock_figures, len(products), path='uncached')
+        Report._get_stock_figures(products.ids)
+        self._measure('calendar.stock_figures', lambda: Report._get_stock_figures(products.ids), len(products),
+                      path='cached', commit_hooks=False)
+
+    def test_calendar_view_reads(self):
+        Report = self.env['custom.calendar.report']
+        self.env['custom.calendar.ledger']._rebuild_cells()
+        self.env['base'].flush()
+        view_fields = list(Report.fields_view_get(view_type='calendar')['fields'])
+        today = self.dataset['random_datetime']().date()
+        month_start = today.replace(day=1)
+        month_end = (month_start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        domain = [('date', '>=', month_start), ('date', '<=', month_end)]
+
+        def read_month():
+            Report.invalidate_cache()
+            Report.search_read(domain, view_fields)
+        self._measure('calendar.read_month', read_month, Report.search_count(domain), path='daily')
+
+        Month = self.env['custom.calendar.report.month']
+        month_fields = list(Month.fields_view_get(view_type='calendar')['fields'])
+        month_domain = [('date_start', '=', month_start)]
+
+        def read_rollup():
+            Month.invalidate_cache()
+            Month.search_read(month_domain, month_fields)
+        self._measure('calendar.read_month', read_rollup, Month.search_count(month_domain), path='monthly_rollup')
@@ -0,0 +1,64 @@
+from datetime import datetime, time, timedelta
+
+from odoo import fields
+from odoo.tests import HttpCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCalendarController(HttpCase):
+    """Conditional requests of the JSON window and streaming of the exports."""
+
+    def setUp(self):
+        super().setUp()
+        self.today = fields.Date.today()
+        self.env['ir.config_parameter'].sudo().set_param('custom_calendar.update_mode', 'commit')
+        self.product = self.env['product.product'].create({'name': 'Calendar Export Product', 'type': 'product'})
+        self.env['mrp.production'].create({
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'product_qty': 4.0,
+            'date_planned_start': datetime.combine(self.today + timedelta(days=3), time(12)),
+        })
+        self.env['base'].flush()
+        self.env.cr.precommit.run()
+        self.authenticate('admin', 'admin')
+        self.query = 'date_from=%s&date_to=%s&product_ids=%s' % (
+            self.today, self.today + timedelta(days=30), self.product.id)
+
+    def test_window_conditional_requests(self):
+        url = '/custom_calendar/report/window?' + self.query
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['products']['ids'], self.product.ids)
+        self.assertEqual(payload['being_manufactured'], [4.0])
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+        self.assertEqual(self.url_open(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.url_open(url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+
+        # any change of a date of the window is seen, even within the same second
+        self.env['custom.calendar.version']._bump({self.today + timedelta(days=10)})
+        self.assertEqual(self.url_open(url, headers={'If-None-Match': etag}).status_code, 200)
+        response = self.url_open(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_export(self):
+        response = self.url_open('/custom_calendar/report/export?file_format=csv&' + self.query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/csv'))
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(self.product.name, lines[1])
+        self.assertIn(fields.Date.to_string(self.today + timedelta(days=3)), lines[1])
+
+        response = self.url_open('/custom_calendar/report/export?layout=pivot&metric=being_manufactured&' + self.query)
+        self.assertEqual(response.status_code, 200)
+        header, row = response.content.decode().splitlines()
+        self.assertEqual(len(header.split(',')), 3 + 31)
+        self.assertEqual(row.split(',')[3:].count('4.0'), 1)
+
+    def test_export_rejects_unknown_layout(self):
+        response = self.url_open('/custom_calendar/report/export?layout=matrix&' + self.query)
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,160 @@
+from datetime import datetime, time, timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import SavepointCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCalendarReport(SavepointCase):
+    """Cells, ledger, rollups, horizon and shortages fed by manufacturing and sale orders."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.today = fields.Date.today()
+        cls.Report = cls.env['custom.calendar.report']
+        cls.Ledger = cls.env['custom.calendar.ledger']
+        cls.env['ir.config_parameter'].sudo().set_param('custom_calendar.update_mode', 'commit')
+        cls.product = cls.env['product.product'].create({'name': 'Calendar Test Product', 'type': 'product'})
+        cls.partner = cls.env['res.partner'].create({'name': 'Calendar Test Partner'})
+
+    def _run_commit_hooks(self):
+        self.env['base'].flush()
+        self.env.cr.precommit.run()
+
+    def _day(self, days):
+        return self.today + timedelta(days=days)
+
+    def _create_production(self, quantity, days):
+        production = self.env['mrp.production'].create({
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'product_qty': quantity,
+            'date_planned_start': datetime.combine(self._day(days), time(12)),
+        })
+        self._run_commit_hooks()
+        return production
+
+    def _sell(self, quantity, days):
+        order = self.env['sale.order'].create({
+            'partner_id': self.partner.id,
+            'commitment_date': datetime.combine(self._day(days), time(12)),
+            'order_line': [(0, 0, {'product_id': self.product.id, 'product_uom_qty': quantity})],
+        })
+        order.action_confirm()
+        self._run_commit_hooks()
+        return order
+
+    def _cells(self):
+        return self.Report.search([('product_id', '=', self.product.id)])
+
+    def _ledger_rows(self):
+        self.Ledger.flush()
+        self.env.cr.execute("""
+            SELECT res_model, res_id, company_id, warehouse_id, date, metric, quantity
+            FROM custom_calendar_ledger WHERE product_id = %s ORDER BY res_model, res_id, date, metric
+        """, (self.product.id,))
+        return self.env.cr.fetchall()
+
+    def test_production_cell(self):
+        production = self._create_production(4.0, 3)
+        cell = self._cells()
+        self.assertEqual(len(cell), 1)
+        self.assertEqual(cell._cell_key(), (
+            self.product.id, production.company_id.id, production.picking_type_id.warehouse_id.id or None, self._day(3)))
+        self.assertEqual(cell.being_manufactured, 4.0)
+        self.assertEqual(cell.stock_on_hand + 4.0, cell.today_current_stock)
+
+        production.write({'date_planned_start': datetime.combine(self._day(5), time(12))})
+        self._run_commit_hooks()
+        cell = self._cells()
+        self.assertEqual(cell.mapped('date'), [self._day(5)], 'the emptied cell is deleted')
+        self.assertEqual(cell.being_manufactured, 4.0)
+
+    def test_resync_is_idempotent(self):
+        production = self._create_production(4.0, 3)
+        rows = self._ledger_rows()
+        self.assertEqual(len(rows), 1)
+        for __ in range(2):
+            keys = self.Ledger._sync_documents(production)
+            self.assertIn(self._cells()._cell_key(), keys)
+            self.assertEqual(self._ledger_rows(), rows)
+
+        self.Report._recompute_cells(keys)
+        self.assertEqual(self._cells().being_manufactured, 4.0)
+
+    def test_upsert_quantities(self):
+        company = self.env.company
+        key = (self.product.id, company.id, None, self._day(2))
+        first = self.Report._upsert_quantities({key: {'sale_order_quantity': 2.0}})
+        second = self.Report._upsert_quantities({key: {'sale_order_quantity': 3.0}})
+        self.assertEqual(first, second, 'cells without warehouse conflict on the same row')
+        # read before the created cell's metrics are computed from the (empty) ledger
+        self.env.cr.execute('SELECT sale_order_quantity FROM custom_calendar_report WHERE id = %s', (second.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], 5.0)
+
+        other = self.Report._upsert_quantities({(self.product.id, company.id, None, self._day(3)): {'being_manufactured': 1.0}})
+        self.assertNotEqual(other, first)
+        self.assertEqual(len(self._cells()), 2)
+
+    def test_rollups(self):
+        monday = self._day(7) - timedelta(days=self._day(7).weekday())
+        self._create_production(4.0, (monday - self.today).days)
+        self._create_production(3.0, (monday - self.today).days + 1)
+
+        week = self.env['custom.calendar.report.week'].search([('product_id', '=', self.product.id)])
+        self.assertEqual(len(week), 1)
+        self.assertEqual(week.date_start, monday)
+        self.assertEqual((week.being_manufactured, week.day_count), (7.0, 2))
+        month = self.env['custom.calendar.report.month'].search([('product_id', '=', self.product.id)])
+        self.assertEqual(sum(month.mapped('being_manufactured')), 7.0)
+        self.assertEqual(sum(month.mapped('day_count')), 2)
+
+    def test_horizon_compaction(self):
+        production = self._create_production(4.0, 3)
+        key = self._cells()._cell_key()
+        # a horizon starting two weeks from now archives the week of the order
+        self.env['ir.config_parameter'].sudo().set_param('custom_calendar.horizon_past_days', '-14')
+        cutoff = self.Report._archive_cutoff()
+        self.assertGreater(cutoff, self._day(3))
+        with patch.object(self.env.cr, 'commit'):
+            self.Report._cron_apply_horizon()
+
+        self.assertFalse(self._cells())
+        archive = self.env['custom.calendar.report.archive'].search([('product_id', '=', self.product.id)])
+        self.assertEqual(archive.mapped('being_manufactured'), [4.0])
+        self.assertEqual(archive.date_start, self._day(3).replace(day=1))
+
+        self.assertFalse(self.Ledger.search([('res_model', '=', 'mrp.production'), ('res_id', '=', production.id)]))
+        opening = self.Ledger.search([('product_id', '=', self.product.id)])
+        self.assertEqual(opening.mapped('date'), [cutoff - timedelta(days=1)])
+        self.assertEqual(opening.quantity, 4.0)
+
+        # monthly rollups keep the archived days
+        Month = self.env['custom.calendar.report.month']
+        Month._refresh({key})
+        month = Month.search([('product_id', '=', self.product.id), ('date_start', '=', archive.date_start)])
+        self.assertEqual(month.being_manufactured, 4.0)
+
+    def test_shortage(self):
+        self._sell(5.0, 4)
+        Shortage = self.env['custom.calendar.shortage']
+        shortage = Shortage.search([('product_id', '=', self.product.id)])
+        self.assertEqual(len(shortage), 1)
+        self.assertEqual((shortage.breach_date, shortage.shortfall), (self._day(4), 5.0))
+        self.assertTrue(shortage.alert_pending)
+
+        messages = self.product.product_tmpl_id.message_ids
+        with patch.object(self.env.cr, 'commit'):
+            Shortage._cron_post_alerts()
+        self.assertFalse(shortage.alert_pending)
+        self.assertEqual(shortage.alerted_shortfall, 5.0)
+        self.assertEqual(len(self.product.product_tmpl_id.message_ids - messages), 1)
+
+        # the same shortage is not posted twice
+        Shortage._refresh(self.product.ids)
+        self.assertFalse(shortage.alert_pending)
+
+        self._create_production(10.0, 2)
+        self.assertFalse(Shortage.search([('product_id', '=', self.product.id)]))
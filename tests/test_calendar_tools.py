@@ -0,0 +1,101 @@
+import random
+import unittest
+
+from odoo.tests import BaseCase
+
+from ..tools import calendar_aggregate
+from ..tools.calendar_cache import WindowCache
+from ..tools.calendar_export import pivot_rows
+
+
+class TestProjectStock(BaseCase):
+
+    def _dataset(self, seed):
+        rng = random.Random(seed)
+        today = 19000
+        cells = [(series, today + day) for series in range(5) for day in range(-10, 30, 3)]
+        openings = {series: float(rng.randint(0, 50)) for series in range(4)}
+        flow_rows = [(rng.randrange(5), today + rng.randint(-20, 40), float(rng.randint(-20, 20))) for __ in range(200)]
+        move_rows = [(rng.randrange(5), today + rng.randint(-20, 40), float(rng.randint(-20, 20))) for __ in range(200)]
+        return cells, openings, flow_rows, move_rows, today
+
+    def test_python_projection(self):
+        # opening 10, +5 yesterday, -3 today, +4 in two days; a move of 2 tomorrow
+        cells = [(1, 99), (1, 100), (1, 101), (1, 102), (2, 100)]
+        flows = [(1, 99, 5.0), (1, 100, -3.0), (1, 102, 4.0)]
+        moves = [(1, 101, 2.0)]
+        stock_on_hand, forecast, today_current = calendar_aggregate._project_stock_python(cells, {1: 10.0}, flows, moves, 100)
+        self.assertEqual(stock_on_hand, [5.0, 10.0, 7.0, 7.0, 0.0])
+        self.assertEqual(forecast, [10.0, 10.0, 12.0, 12.0, 0.0])
+        self.assertEqual(today_current, [10.0, 7.0, 7.0, 11.0, 0.0])
+
+    @unittest.skipIf(calendar_aggregate.np is None, 'numpy is not installed')
+    def test_numpy_python_parity(self):
+        for seed in range(3):
+            args = self._dataset(seed)
+            expected = calendar_aggregate._project_stock_python(*args)
+            result = calendar_aggregate._project_stock_numpy(*args)
+            for expected_values, values in zip(expected, result):
+                self.assertEqual(len(values), len(expected_values))
+                for expected_value, value in zip(expected_values, values):
+                    self.assertAlmostEqual(value, expected_value)
+
+    @unittest.skipIf(calendar_aggregate.np is None, 'numpy is not installed')
+    def test_numpy_without_rows(self):
+        self.assertEqual(
+            calendar_aggregate._project_stock_numpy([(1, 100), (1, 101)], {1: 3.0}, [], [], 100),
+            ([3.0, 3.0], [3.0, 3.0], [3.0, 3.0]),
+        )
+
+
+class TestPivotRows(BaseCase):
+
+    def test_pivot(self):
+        rows = [
+            ('A', 1, 2.0),
+            ('A', 3, None),
+            ('B', 2, 5.0),
+            ('B', 4, 1.0),
+        ]
+        self.assertEqual(list(pivot_rows(rows, [1, 2, 3])), [
+            ('A', [2.0, 0.0, 0.0]),
+            ('B', [0.0, 5.0, 0.0]),
+        ])
+
+    def test_pivot_empty(self):
+        self.assertEqual(list(pivot_rows([], [1, 2])), [])
+
+
+class TestWindowCache(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = WindowCache()
+
+    def test_version(self):
+        self.cache.put('window', 1, 'abc', 100)
+        self.assertEqual(self.cache.get('window', 1), 'abc')
+        self.assertIsNone(self.cache.get('window', 2))
+        # the stale entry was dropped
+        self.assertIsNone(self.cache.get('window', 1))
+        self.assertEqual(self.cache.stats(), {
+            'entries': 0, 'size': 0, 'hits': 1, 'misses': 2, 'invalidations': 1, 'evictions': 0,
+        })
+
+    def test_eviction(self):
+        self.cache.put('a', 1, 'xxxx', 10)
+        self.cache.put('b', 1, 'xxxx', 10)
+        self.cache.get('a', 1)
+        self.cache.put('c', 1, 'xxxx', 10)
+        # 'b' is the least recently used entry
+        self.assertIsNone(self.cache.get('b', 1))
+        self.assertEqual(self.cache.get('a', 1), 'xxxx')
+        self.assertEqual(self.cache.get('c', 1), 'xxxx')
+        self.assertEqual(self.cache.stats()['size'], 8)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_oversized_value(self):
+        self.cache.put('a', 1, 'xxxx', 10)
+        self.cache.put('a', 2, 'x' * 11, 10)
+        self.assertIsNone(self.cache.get('a', 2))
+        self.assertEqual(self.cache.stats()['size'], 0)
@@ -0,0 +1,5 @@
+from . import calendar_aggregate
+from . import calendar_cache
+from . import calendar_export
+from . import calendar_log
+from . import calendar_perf
@@ -0,0 +1,106 @@
+from bisect import bisect_left
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    _logger.debug('numpy is not installed, calendar projections are aggregated in pure Python')
+
+
+def project_stock(cells, openings, flow_rows, move_rows, today):
+    """Project the stock of calendar cells over raw daily flows.
+
+    ``cells`` is a list of ``(series, day)``, a series being an integer
+    identifying the stock of one product at one site. ``openings`` maps
+    series to their quantity on hand today, ``flow_rows`` and ``move_rows``
+    are raw ``(series, day, signed quantity)`` tuples of the ledger and of
+    the pending stock moves. Days are integers (days since epoch), ``today``
+    included. Returns ``(stock_on_hand, forecast_quantity, today_current_stock)``
+    sequences aligned on ``cells``:
+
+    - stock on hand: opening plus the flows between today and the start of the day,
+    - forecast: opening plus every pending move planned up to the end of the day,
+    - current stock's left: stock on hand plus the flows of the day.
+    """
+    if np is not None:
+        return _project_stock_numpy(cells, openings, flow_rows, move_rows, today)
+    return _project_stock_python(cells, openings, flow_rows, move_rows, today)
+
+
+def _project_stock_numpy(cells, openings, flow_rows, move_rows, today):
+    cells = np.array(cells, dtype=np.int64).reshape(-1, 2)
+    flows = np.array(flow_rows, dtype=np.float64).reshape(-1, 3)
+    moves = np.array(move_rows, dtype=np.float64).reshape(-1, 3)
+    products, days = cells[:, 0], cells[:, 1]
+    opening = np.array([openings.get(product_id, 0.0) or 0.0 for product_id in products.tolist()], dtype=np.float64)
+
+    # (product, day) pairs are packed into sortable int64 keys
+    all_days = np.concatenate([days, flows[:, 1].astype(np.int64), moves[:, 1].astype(np.int64), [today]])
+    base = int(all_days.min())
+    span = int(all_days.max()) - base + 2
+
+    def keys(product_ids, day_numbers):
+        return product_ids.astype(np.int64) * span + (day_numbers.astype(np.int64) - base)
+
+    def sums_before(rows, product_ids, day_numbers):
+        # sum of the rows of each product dated strictly before the day, from one sorted cumulative sum
+        row_keys = keys(rows[:, 0], rows[:, 1])
+        order = np.argsort(row_keys, kind='stable')
+        row_keys = row_keys[order]
+        cumulative = np.concatenate([[0.0], np.cumsum(rows[order, 2])])
+        end = np.searchsorted(row_keys, keys(product_ids, day_numbers), side='left')
+        start = np.searchsorted(row_keys, keys(product_ids, np.full_like(day_numbers, base)), side='left')
+        return cumulative[end] - cumulative[start]
+
+    def daily_sums(rows, product_ids, day_numbers):
+        # rows grouped by (product, day) with bincount, then looked up for each cell
+        result = np.zeros(len(product_ids), dtype=np.float64)
+        if not len(rows):
+            return result
+        unique_keys, inverse = np.unique(keys(rows[:, 0], rows[:, 1]), return_inverse=True)
+        totals = np.bincount(inverse, weights=rows[:, 2])
+        cell_keys = keys(product_ids, day_numbers)
+        index = np.searchsorted(unique_keys, cell_keys)
+        found = index < len(unique_keys)
+        found[found] = unique_keys[index[found]] == cell_keys[found]
+        result[found] = totals[index[found]]
+        return result
+
+    stock_on_hand = opening + sums_before(flows, products, days) - sums_before(flows, products, np.full_like(days, today))
+    forecast = opening + sums_before(moves, products, days + 1)
+    today_current = stock_on_hand + daily_sums(flows, products, days)
+    return stock_on_hand.tolist(), forecast.tolist(), today_current.tolist()
+
+
+def _project_stock_python(cells, openings, flow_rows, move_rows, today):
+    def cumulate(rows):
+        # {product_id: (sorted days, cumulative sums with a leading 0, daily totals)}
+        grouped = defaultdict(lambda: defaultdict(float))
+        for product_id, day, quantity in rows:
+            grouped[product_id][day] += quantity or 0.0
+        result = {}
+        for product_id, quantities in grouped.items():
+            days = sorted(quantities)
+            cumulative = [0.0]
+            for day in days:
+                cumulative.append(cumulative[-1] + quantities[day])
+            result[product_id] = (days, cumulative, quantities)
+        return result
+
+    def sums_before(cumulated, product_id, day):
+        days, cumulative, __ = cumulated.get(product_id, ((), (0.0,), {}))
+        return cumulative[bisect_left(days, day)]
+
+    flows, moves = cumulate(flow_rows), cumulate(move_rows)
+    stock_on_hand, forecast, today_current = [], [], []
+    for product_id, day in cells:
+        opening = openings.get(product_id, 0.0) or 0.0
+        on_hand = opening + sums_before(flows, product_id, day) - sums_before(flows, product_id, today)
+        stock_on_hand.append(on_hand)
+        forecast.append(opening + sums_before(moves, product_id, day + 1))
+        today_current.append(on_hand + flows.get(product_id, ((), (), {}))[2].get(day, 0.0))
+    return stock_on_hand, forecast, today_current
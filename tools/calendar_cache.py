@@ -0,0 +1,65 @@
+from collections import OrderedDict
+import threading
+
+
+class WindowCache(object):
+    """Bounded LRU of serialized calendar windows, sized by the length of the cached values.
+
+    Every entry remembers the version of its window when it was filled; a
+    lookup with another version is a miss and drops the entry, so entries
+    are invalidated as soon as a cell of their window changes, in any worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = self.misses = self.invalidations = self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._pop(key)
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value, max_size):
+        with self._lock:
+            self._pop(key)
+            if len(value) > max_size:
+                return
+            self._entries[key] = (version, value)
+            self._size += len(value)
+            while self._size > max_size:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+window_cache = WindowCache()
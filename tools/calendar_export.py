@@ -0,0 +1,71 @@
+import csv
+import io
+import logging
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+    _logger.debug('xlsxwriter is not installed, calendar exports are only available as CSV')
+
+# Bytes read from the spooled workbook per response chunk
+XLSX_CHUNK_SIZE = 64 * 1024
+
+
+def pivot_rows(rows, dates):
+    """Fold ``(series, date, value)`` rows into one ``(series, values)`` row per series.
+
+    ``rows`` must be ordered by series, and ``values`` holds one value per
+    day of ``dates``, 0 for the days without a row. Only the row being
+    folded is kept in memory.
+    """
+    index = {day: position for position, day in enumerate(dates)}
+    series, values = None, None
+    for row_series, day, value in rows:
+        if row_series != series:
+            if series is not None:
+                yield series, values
+            series, values = row_series, [0.0] * len(dates)
+        if day in index:
+            values[index[day]] = value or 0.0
+    if series is not None:
+        yield series, values
+
+
+def csv_chunks(header, rows, chunk_rows=1000):
+    """Serialize ``rows`` as CSV, yielding encoded chunks of ``chunk_rows`` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def xlsx_chunks(header, rows, sheet_name='Calendar'):
+    """Serialize ``rows`` as an XLSX workbook, yielding chunks of the finished file.
+
+    An XLSX file is a zip archive only complete once closed: rows are
+    written in xlsxwriter's constant memory mode, which flushes every row to
+    disk, then the workbook is streamed from its temporary file.
+    """
+    with tempfile.TemporaryFile() as spool:
+        workbook = xlsxwriter.Workbook(spool, {'constant_memory': True})
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, header, workbook.add_format({'bold': True}))
+        for row_index, row in enumerate(rows, start=1):
+            sheet.write_row(row_index, 0, row)
+        workbook.close()
+        spool.seek(0)
+        while True:
+            chunk = spool.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
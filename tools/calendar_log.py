@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+import logging
+import random
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class LazyFields(object):
+    """Structured ``key=value`` fields formatted only when a handler emits the record.
+
+    Callable values are evaluated at that time as well, so expensive values
+    (names, computed quantities) cost nothing when the record is dropped.
+    """
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return ' '.join('%s=%s' % (key, value() if callable(value) else value) for key, value in self.fields.items())
+
+
+def per_record_logs_enabled(env):
+    return env['ir.config_parameter'].sudo().get_param('custom_calendar.per_record_logs', 'True') not in ('False', 'false', '0')
+
+
+def _sample_rate(env, event):
+    ICP = env['ir.config_parameter'].sudo()
+    rate = ICP.get_param('custom_calendar.log_sample_rate.%s' % event) or ICP.get_param('custom_calendar.log_sample_rate', '1.0')
+    try:
+        return float(rate)
+    except ValueError:
+        return 1.0
+
+
+def log_event(env, event, level=logging.DEBUG, **fields):
+    """Log a per-record ``event`` with structured ``fields``, subject to the kill switch and sampling.
+
+    The sample rate of an event is read from the
+    ``custom_calendar.log_sample_rate.<event>`` system parameter, falling
+    back to ``custom_calendar.log_sample_rate``.
+    """
+    if not _logger.isEnabledFor(level) or not per_record_logs_enabled(env):
+        return
+    rate = _sample_rate(env, event)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    _logger.log(level, '%s %s', event, LazyFields(fields))
+
+
+@contextmanager
+def log_batch(event, **fields):
+    """Log one INFO summary of a batch: ``fields``, ``rows`` and ``duration_ms``.
+
+    The yielded dict can be updated by the batch, typically with the number
+    of rows it touched::
+
+        with log_batch('calendar.recompute', cells=len(keys)) as summary:
+            ...
+            summary['rows'] = len(reports)
+    """
+    summary = dict(fields, rows=0)
+    start = time.perf_counter()
+    try:
+        yield summary
+    finally:
+        summary['duration_ms'] = round((time.perf_counter() - start) * 1000.0, 1)
+        _logger.info('%s %s', event, LazyFields(summary))
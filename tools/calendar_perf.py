@@ -0,0 +1,163 @@
+from collections import defaultdict
+from datetime import datetime
+import functools
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets, the last bucket is unbounded
+HISTOGRAM_BOUNDS = [1, 10, 50, 100, 500, 1000]
+HISTOGRAM_FIELDS = ['bucket_le_1', 'bucket_le_10', 'bucket_le_50', 'bucket_le_100', 'bucket_le_500', 'bucket_le_1000', 'bucket_gt_1000']
+
+# Seconds between two flushes of the in-process statistics to the database
+FLUSH_INTERVAL = 60
+# Slow calls kept per database between two flushes
+MAX_SLOW_CALLS = 100
+
+_lock = threading.Lock()
+# {dbname: {method: {'calls', 'total_ms', 'max_ms', 'sql_count', bucket fields...}}}
+_stats = defaultdict(dict)
+# {dbname: [slow call vals]}
+_slow_calls = defaultdict(list)
+_last_flush = {}
+
+
+def _settings(env):
+    ICP = env['ir.config_parameter'].sudo()
+    enabled = ICP.get_param('custom_calendar.instrumentation', 'True') not in ('False', 'false', '0')
+    return enabled, float(ICP.get_param('custom_calendar.slow_call_ms', '500') or 500)
+
+
+def _call_context(records, args):
+    """Return ``(product_id, date)`` identifying the call for slow-call capture, when there is one.
+
+    Records are only read from the cache: this runs after the call, possibly
+    on an aborted transaction whose exception a query would mask.
+    """
+    if records._name == 'custom.calendar.report' and records._ids:
+        record = records.browse(records._ids[0])
+        try:
+            # the cache holds the id of many2one values
+            return (records.env.cache.get(record, records._fields['product_id']),
+                    records.env.cache.get(record, records._fields['date']))
+        except KeyError:
+            return False, False
+    if args and isinstance(args[0], (set, frozenset, list)) and args[0]:
+        key = next(iter(args[0]))
+        if isinstance(key, tuple) and len(key) >= 2:
+            return key[0], key[-1]
+    return False, False
+
+
+def instrumented(name):
+    """Record the latency and SQL query count of the decorated model method under ``name``.
+
+    Statistics are accumulated in memory and flushed every
+    ``FLUSH_INTERVAL`` seconds; calls slower than the
+    ``custom_calendar.slow_call_ms`` system parameter are captured with the
+    product and date they were working on.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            enabled, slow_ms = _settings(self.env)
+            if not enabled:
+                return method(self, *args, **kwargs)
+            cr = self.env.cr
+            sql_start = cr.sql_log_count
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                duration_ms = (time.perf_counter() - start) * 1000.0
+                sql_count = cr.sql_log_count - sql_start
+                _record(self, name, duration_ms, sql_count, slow_ms, args)
+        return wrapper
+    return decorator
+
+
+def _record(records, name, duration_ms, sql_count, slow_ms, args):
+    dbname = records.env.cr.dbname
+    with _lock:
+        stat = _stats[dbname].get(name)
+        if stat is None:
+            stat = _stats[dbname][name] = dict({'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql_count': 0},
+                                               **dict.fromkeys(HISTOGRAM_FIELDS, 0))
+        stat['calls'] += 1
+        stat['total_ms'] += duration_ms
+        stat['max_ms'] = max(stat['max_ms'], duration_ms)
+        stat['sql_count'] += sql_count
+        for bound, fname in zip(HISTOGRAM_BOUNDS + [None], HISTOGRAM_FIELDS):
+            if bound is None or duration_ms <= bound:
+                stat[fname] += 1
+                break
+    if duration_ms >= slow_ms:
+        product_id, date = _call_context(records, args)
+        with _lock:
+            if len(_slow_calls[dbname]) < MAX_SLOW_CALLS:
+                _slow_calls[dbname].append({
+                    'method': name,
+                    'duration_ms': duration_ms,
+                    'sql_count': sql_count,
+                    'res_model': records._name,
+                    'res_ids': ','.join(str(res_id) for res_id in records.ids[:20]),
+                    'record_count': len(records),
+                    'product_id': product_id or None,
+                    'date': date or None,
+                    'called_at': datetime.utcnow(),
+                })
+    if time.time() - _last_flush.get(dbname, 0) >= FLUSH_INTERVAL and not records.env.registry.in_test_mode():
+        flush_stats(records.env.registry)
+
+
+def discard_stats():
+    """Drop the statistics accumulated so far in this process, e.g. the ones inherited through a fork."""
+    with _lock:
+        _stats.clear()
+        _slow_calls.clear()
+
+
+def flush_stats(registry, cr=None):
+    """Write the statistics accumulated for ``registry``'s database.
+
+    A dedicated cursor is used unless ``cr`` is given, so that the
+    statistics neither depend on nor lock the instrumented transaction.
+    """
+    dbname = registry.db_name
+    with _lock:
+        stats = _stats.pop(dbname, {})
+        slow_calls = _slow_calls.pop(dbname, [])
+        _last_flush[dbname] = time.time()
+    if not stats and not slow_calls:
+        return
+    try:
+        if cr is None:
+            with registry.cursor() as new_cr:
+                _write_stats(new_cr, stats, slow_calls)
+        else:
+            _write_stats(cr, stats, slow_calls)
+    except Exception:
+        _logger.warning('Could not flush the calendar performance statistics', exc_info=True)
+
+
+def _write_stats(cr, stats, slow_calls):
+    for method, stat in stats.items():
+        columns = ['calls', 'total_ms', 'sql_count'] + HISTOGRAM_FIELDS
+        cr.execute("""
+            INSERT INTO custom_calendar_perf_stat (method, day, max_ms, {columns})
+            VALUES (%s, (now() at time zone 'UTC')::date, %s, {placeholders})
+            ON CONFLICT (method, day) DO UPDATE SET
+                max_ms = greatest(custom_calendar_perf_stat.max_ms, EXCLUDED.max_ms),
+                {increments}
+        """.format(
+            columns=', '.join(columns),
+            placeholders=', '.join(['%s'] * len(columns)),
+            increments=', '.join('{0} = custom_calendar_perf_stat.{0} + EXCLUDED.{0}'.format(column) for column in columns),
+        ), [method, stat['max_ms']] + [stat[column] for column in columns])
+    for vals in slow_calls:
+        cr.execute("""
+            INSERT INTO custom_calendar_perf_slow (method, duration_ms, sql_count, res_model, res_ids, record_count, product_id, date, called_at)
+            VALUES (%(method)s, %(duration_ms)s, %(sql_count)s, %(res_model)s, %(res_ids)s, %(record_count)s, %(product_id)s, %(date)s, %(called_at)s)
+        """, vals)